@@ -2,29 +2,85 @@
 Manage the Vault PKI secret engine.
 .. important::
     This module requires the general :ref:`Vault setup <vault-setup>`.
+
+.. note::
+    Roles and issuers that were read are cached in ``__context__`` for
+    60 seconds. Writing or deleting a role through this module invalidates
+    the cached data for it.
 """
 
+import copy
 import logging
-from datetime import datetime
-from datetime import timezone
-from cryptography.hazmat.primitives import hashes, serialization
+import time
+from concurrent.futures import as_completed
+from concurrent.futures import ThreadPoolExecutor
 
+import salt.utils.x509 as x509util
 import saltext.vault.utils.vault as vault
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives import serialization
+from requests.adapters import DEFAULT_POOLSIZE
 from salt.exceptions import CommandExecutionError
 from salt.exceptions import SaltInvocationError
-import salt.utils.x509 as x509util
-
-
-# import debugpy
-
-# # Allow other computers to attach to debugpy at this IP address and port.
-# debugpy.listen(('0.0.0.0', 5678))
-
-# # Pause the program until a remote debugger is attached
-# debugpy.wait_for_client()
 
 log = logging.getLogger(__name__)
 
+CONTEXT_KEY = "vault_pki"
+# Seconds to reuse read-only responses for
+CACHE_TTL = 60
+
+# Named parameters of write_role that are sent as part of the payload
+_ROLE_FIELDS = (
+    "issuer",
+    "ttl",
+    "max_ttl",
+    "allow_localhost",
+    "allowed_domains",
+    "server_flag",
+    "client_flag",
+    "key_usage",
+    "no_store",
+    "require_cn",
+    "cn_validations",
+)
+
+_DIGESTS = {
+    "sha1": hashes.SHA1,
+    "sha224": hashes.SHA224,
+    "sha256": hashes.SHA256,
+    "sha384": hashes.SHA384,
+    "sha512": hashes.SHA512,
+    "sha512_224": hashes.SHA512_224,
+    "sha512_256": hashes.SHA512_256,
+    "sha3_224": hashes.SHA3_224,
+    "sha3_256": hashes.SHA3_256,
+    "sha3_384": hashes.SHA3_384,
+    "sha3_512": hashes.SHA3_512,
+}
+
+_VALID_CSR_ARGS = frozenset(
+    (
+        "C",
+        "ST",
+        "L",
+        "STREET",
+        "O",
+        "OU",
+        "CN",
+        "MAIL",
+        "SN",
+        "GN",
+        "UID",
+        "basicConstraints",
+        "keyUsage",
+        "subjectKeyIdentifier",
+        "authorityKeyIdentifier",
+        "certificatePolicies",
+        "policyConstraints",
+        "nameConstraints",
+    )
+)
+
 def list_roles(mount='pki'):
     """
     List configured PKI roles.
@@ -39,13 +95,19 @@ def list_roles(mount='pki'):
     mount
         The mount path the DB backend is mounted to. Defaults to ``pki``.
     """
+    ckey = ("list_roles", mount)
+    roles = _get_cached(ckey)
+    if roles is not None:
+        return roles
     endpoint = f"{mount}/roles"
     try:
-        return vault.query("LIST", endpoint, __opts__, __context__)["data"]["keys"]
+        roles = vault.query("LIST", endpoint, __opts__, __context__)["data"]["keys"]
     except vault.VaultNotFoundError:
-        return []
+        roles = []
     except vault.VaultException as err:
         raise CommandExecutionError(f"{err.__class__}: {err}") from err
+    _set_cached(ckey, roles)
+    return roles
 
 def read_role(name, mount='pki'):
     """
@@ -64,11 +126,15 @@ def read_role(name, mount='pki'):
     mount
         The mount path the DB backend is mounted to. Defaults to ``pki``.
     """
-    
+    ckey = ("read_role", mount, name)
+    role = _get_cached(ckey)
+    if role is not None:
+        return role
     endpoint = f"{mount}/roles/{name}"
     try:
         res = vault.query("GET", endpoint, __opts__, __context__)
         if isinstance(res , dict):
+            _set_cached(ckey, res["data"])
             return res["data"]
         return False
     except vault.VaultNotFoundError:
@@ -92,35 +158,53 @@ def write_role(
     cn_validations=None,
     **kwargs
 ):
-    args = locals()
     endpoint = f"{mount}/roles/{name}"
-    
-    method = "POST"
-    headers = {}
-
-    
-    if read_role(name, mount=mount) is not None:
-        method = "PATCH"
-        headers = {
-            "Content-Type": "application/merge-patch+json"
-        }
 
-    payload = {k: v for k, v in kwargs.items() if not k.startswith("_")}
-
-    for k,v in args.items():
-        if k not in ["name", "mount", "kwargs"]:
-            if v is not None:
-                payload[k] = v
-
-
-    for m in [method, "POST"]:
-        try:
-            vault.query(m, endpoint, __opts__, __context__, payload=payload, add_headers=headers)
-            return True
-        except vault.VaultUnsupportedOperationError:
-            continue  
-        except vault.VaultException as err:
-            raise CommandExecutionError(f"{err.__class__}: {err}") from err
+    payload = _filter_kwargs(kwargs)
+
+    values = (
+        issuer,
+        ttl,
+        max_ttl,
+        allow_localhost,
+        allowed_domains,
+        server_flag,
+        client_flag,
+        key_usage,
+        no_store,
+        require_cn,
+        cn_validations,
+    )
+    for k, v in zip(_ROLE_FIELDS, values):
+        if v is not None:
+            payload[k] = v
+
+    # Try to update an existing role in place first. Vault responds with 404
+    # if the role does not exist yet and with 405 if it does not support
+    # patching roles, in which case the role is written as a whole.
+    # The latter is remembered to avoid sending requests that are bound to fail.
+    try:
+        if _get_cached(("supports_patch",)) is not False:
+            try:
+                vault.query(
+                    "PATCH",
+                    endpoint,
+                    __opts__,
+                    __context__,
+                    payload=payload,
+                    add_headers={"Content-Type": "application/merge-patch+json"},
+                )
+                return True
+            except vault.VaultNotFoundError:
+                pass
+            except vault.VaultUnsupportedOperationError:
+                _set_cached(("supports_patch",), False)
+        vault.query("POST", endpoint, __opts__, __context__, payload=payload)
+        return True
+    except vault.VaultException as err:
+        raise CommandExecutionError(f"{err.__class__}: {err}") from err
+    finally:
+        _invalidate(("list_roles", mount), ("read_role", mount, name))
 
 def delete_role(
     name,
@@ -135,29 +219,58 @@ def delete_role(
         return False
     except vault.VaultException as err:
         raise CommandExecutionError(f"{err.__class__}: {err}") from err
+    finally:
+        _invalidate(("list_roles", mount), ("read_role", mount, name))
 
 def list_issuers(mount='pki'):
+    ckey = ("list_issuers", mount)
+    issuers = _get_cached(ckey)
+    if issuers is not None:
+        return issuers
     endpoint = f"{mount}/issuers"
 
     try:
-        return vault.query("LIST", endpoint, __opts__, __context__)['data']['key_info']
+        issuers = vault.query("LIST", endpoint, __opts__, __context__)['data']['key_info']
     except vault.VaultException as err:
         raise CommandExecutionError(f"{err.__class__}: {err}") from err
+    _set_cached(ckey, issuers)
+    return issuers
 
 def read_issuer(name, mount='pki'):
+    ckey = ("read_issuer", mount, name)
+    issuer = _get_cached(ckey)
+    if issuer is not None:
+        return issuer
     endpoint = f"{mount}/issuer/{name}"
 
     try:
-        return vault.query("GET", endpoint, __opts__, __context__)['data']
+        issuer = vault.query("GET", endpoint, __opts__, __context__)['data']
     except vault.VaultNotFoundError:
         return None
     except vault.VaultException as err:
         raise CommandExecutionError(f"{err.__class__}: {err}") from err
+    _set_cached(ckey, issuer)
+    return issuer
 
 def read_issuer_certificate(name, mount='pki'):
-    certificate = read_issuer(name, mount)
+    """
+    Get the PEM-encoded certificate of a PKI issuer. The result is cached
+    in ``__context__`` for a short time since it is requested for each
+    managed certificate.
 
-    return certificate["certificate"]
+    CLI Example:
+
+    .. code-block:: bash
+
+            salt '*' vault_pki.read_issuer_certificate default
+
+    name
+        The name or ID of the issuer.
+
+    mount
+        The mount path the PKI backend is mounted to. Defaults to ``pki``.
+    """
+    return read_issuer(name, mount)["certificate"]
 
 
 def issue_certificate(
@@ -171,31 +284,96 @@ def issue_certificate(
         exclude_cn_from_sans=False,
         **kwargs
 ):
-    endpoint = f"{mount}/issue/{role_name}"
-    if issuer is not None:
-        endpoint = f"{mount}/issuer/{issuer}/issue/{role_name}"
+    endpoint, payload = _issue_request(
+        role_name,
+        common_name,
+        mount=mount,
+        issuer=issuer,
+        alt_names=alt_names,
+        ttl=ttl,
+        format=format,
+        exclude_cn_from_sans=exclude_cn_from_sans,
+        **kwargs
+    )
+    try:
+        return vault.query("POST", endpoint, __opts__, __context__, payload=payload)['data']
+    except vault.VaultException as err:
+        raise CommandExecutionError(f"{err.__class__}: {err}") from err
 
-    payload = {k: v for k, v in kwargs.items() if not k.startswith("_")}
-    payload["common_name"] = common_name
-    
-    if ttl is not None:
-        payload["ttl"] = ttl
+def issue_certificates(certificates, mount="pki", max_workers=8):
+    """
+    Issue several certificates at once. Returns a dictionary mapping
+    the common names to the issued certificate data.
 
-    payload["format"] = format
-    payload["exclude_cn_from_sans"] = exclude_cn_from_sans
+    The requests are sent concurrently if the active Vault token has
+    unlimited uses, otherwise one after another.
 
-    if alt_names is not None:
-        dns_sans, ip_sans, uri_sans, other_sans = _split_sans(alt_names)
-        payload["alt_names"] = dns_sans
-        payload["ip_sans"] = ip_sans
-        payload["uri_sans"] = uri_sans
-        payload["other_sans"] = other_sans
+    CLI Example:
+
+    .. code-block:: bash
+
+            salt '*' vault_pki.issue_certificates '[{"role_name": "web", "common_name": "a.example.com"}]'
+
+    certificates
+        List of dictionaries containing the parameters to
+        :py:func:`issue_certificate` for each certificate.
+        ``role_name`` and ``common_name`` are required and the
+        common names must be unique.
+
+    mount
+        The mount path the PKI backend is mounted to, unless overridden
+        per certificate. Defaults to ``pki``.
+
+    max_workers
+        The maximum number of concurrent requests. Defaults to 8. Capped
+        to the connection pool size of the session, which is 10.
+    """
+    certificates = [{"mount": mount, **cert} for cert in certificates]
+    common_names = [cert["common_name"] for cert in certificates]
+    duplicates = {cn for cn in common_names if common_names.count(cn) > 1}
+    if duplicates:
+        raise SaltInvocationError(
+            f"Common names must be unique, found duplicates: {', '.join(sorted(duplicates))}"
+        )
+
+    if len(certificates) < 2:
+        return {cert["common_name"]: issue_certificate(**cert) for cert in certificates}
 
     try:
-        return vault.query("POST", endpoint, __opts__, __context__, payload=payload)['data']
+        client = vault.get_authd_client(__opts__, __context__)
     except vault.VaultException as err:
         raise CommandExecutionError(f"{err.__class__}: {err}") from err
 
+    # Limited-use tokens are replaced frequently, which must not happen concurrently.
+    if client.auth.get_token().num_uses != 0:
+        return {cert["common_name"]: issue_certificate(**cert) for cert in certificates}
+
+    # The workers share the client that was acquired here and do not touch
+    # __context__, which holds the cached client and token.
+    ret = {}
+    denied = []
+    # More workers than pooled connections would only open and discard
+    # additional connections.
+    with ThreadPoolExecutor(max_workers=min(max_workers, DEFAULT_POOLSIZE)) as executor:
+        futures = {}
+        for cert in certificates:
+            endpoint, payload = _issue_request(**cert)
+            futures[executor.submit(client.post, endpoint, payload=payload)] = cert
+        for future in as_completed(futures):
+            cert = futures[future]
+            try:
+                ret[cert["common_name"]] = future.result()["data"]
+            except vault.VaultPermissionDeniedError:
+                denied.append(cert)
+            except vault.VaultException as err:
+                raise CommandExecutionError(f"{err.__class__}: {err}") from err
+
+    # Let the regular query handle refreshing the cached authentication
+    # in case the policies have changed.
+    for cert in denied:
+        ret[cert["common_name"]] = issue_certificate(**cert)
+    return ret
+
 def sign_certificate(
         role_name,
         common_name,
@@ -223,7 +401,7 @@ def sign_certificate(
     if issuer is not None:
         endpoint = f"{mount}/issuer/{issuer}/sign/{role_name}"
 
-    payload = {k: v for k, v in extra_args.items() if not k.startswith("_")}
+    payload = _filter_kwargs(extra_args)
 
     payload["common_name"] = common_name
 
@@ -243,16 +421,11 @@ def sign_certificate(
     # In case private_key is passed we're going to build
     # CSR in place.
     if private_key is not None:
-        if isinstance(alt_names, dict):
-            alt_names = [ f"{k}:{v}" for k, v in alt_names.items() ]
-        
-        if alt_names:
-            csr_args["subjectAltName"] = alt_names
-
         csr = _build_csr(
             private_key=private_key,
             private_key_passphrase=private_key_passphrase,
             digest=digest,
+            subject_alt_name=alt_names,
             **csr_args
         )
 
@@ -264,50 +437,127 @@ def sign_certificate(
     except vault.VaultException as err:
         raise CommandExecutionError(f"{err.__class__}: {err}") from err
 
+def close_session():
+    """
+    Close the HTTP connections kept open to the Vault server.
+
+    All functions of this module reuse the connections of the Vault client
+    cached in ``__context__``. They are closed automatically when the
+    process exits, this can be used to release them earlier.
+
+    CLI Example:
+
+    .. code-block:: bash
+
+            salt '*' vault_pki.close_session
+    """
+    return vault.close_session(__opts__, __context__)
+
+def _filter_kwargs(kwargs):
+    """
+    Drops Salt-internal keyword arguments like ``__pub_fun``.
+    """
+    if not kwargs:
+        return {}
+    return {k: v for k, v in kwargs.items() if not k.startswith("_")}
+
+
+def _get_cached(ckey):
+    cached = __context__.get(CONTEXT_KEY, {}).get(ckey)
+    if cached is None or time.monotonic() - cached[0] >= CACHE_TTL:
+        return None
+    # Do not leak modifications of returned data into the cache
+    return copy.deepcopy(cached[1])
+
+
+def _set_cached(ckey, value):
+    __context__.setdefault(CONTEXT_KEY, {})[ckey] = (time.monotonic(), copy.deepcopy(value))
+
+
+def _invalidate(*ckeys):
+    cache = __context__.get(CONTEXT_KEY, {})
+    for ckey in ckeys:
+        cache.pop(ckey, None)
+
+def _issue_request(
+        role_name,
+        common_name,
+        mount="pki",
+        issuer=None,
+        alt_names=None,
+        ttl=None,
+        format="pem",
+        exclude_cn_from_sans=False,
+        **kwargs
+):
+    endpoint = f"{mount}/issue/{role_name}"
+    if issuer is not None:
+        endpoint = f"{mount}/issuer/{issuer}/issue/{role_name}"
+
+    payload = _filter_kwargs(kwargs)
+    payload["common_name"] = common_name
+
+    if ttl is not None:
+        payload["ttl"] = ttl
+
+    payload["format"] = format
+    payload["exclude_cn_from_sans"] = exclude_cn_from_sans
+
+    if alt_names is not None:
+        dns_sans, ip_sans, uri_sans, other_sans = _split_sans(alt_names)
+        payload["alt_names"] = dns_sans
+        payload["ip_sans"] = ip_sans
+        payload["uri_sans"] = uri_sans
+        payload["other_sans"] = other_sans
+
+    return endpoint, payload
+
 def _split_sans(sans):
     dns_sans = []
     ip_sans = []
     uri_sans = []
     other_sans = []
+    # Vault expects email addresses in alt_names as well
+    buckets = {"DNS": dns_sans, "EMAIL": dns_sans, "IP": ip_sans, "URI": uri_sans}
 
     if isinstance(sans, list):
-        sans = { item.split(":", 1) for item in sans }
-    
-    for k,v in sans.items():
-        if k.upper() == "DNS" or k.upper() == "EMAIL":
-            dns_sans.append(v)
-        elif k.upper() == "IP":
-            ip_sans.append(v)
-        elif k.upper() == "URI":
-            uri_sans.append(v)
+        pairs = []
+        for item in sans:
+            if not isinstance(item, str) or ":" not in item:
+                raise SaltInvocationError(
+                    f"Invalid alt name '{item}'. Expected the format TYPE:value, e.g. DNS:{item}"
+                )
+            pairs.append(item.split(":", 1))
+    else:
+        pairs = sans.items()
+
+    for k, v in pairs:
+        bucket = buckets.get(k.upper())
+        if bucket is not None:
+            bucket.append(v)
         else:
             other_sans.append(f"{k};UTF8:{v}")
-    
+
     return dns_sans, ip_sans, uri_sans, other_sans
 
 
 def _build_csr(
         private_key,
         private_key_passphrase=None,
-        digest="sha256", 
+        digest="sha256",
+        subject_alt_name=None,
         **kwargs):
-    if digest.lower() not in [
-        "sha1",
-        "sha224",
-        "sha256",
-        "sha384",
-        "sha512",
-        "sha512_224",
-        "sha512_256",
-        "sha3_224",
-        "sha3_256",
-        "sha3_384",
-        "sha3_512",
-    ]:
+    # The SANs split for Vault cannot be reused here since email addresses
+    # are merged into the DNS names there.
+    if isinstance(subject_alt_name, dict):
+        subject_alt_name = [f"{k}:{v}" for k, v in subject_alt_name.items()]
+    if subject_alt_name:
+        kwargs["subjectAltName"] = subject_alt_name
+
+    digest_cls = _DIGESTS.get(digest.lower())
+    if digest_cls is None:
         raise CommandExecutionError(
-            f"Invalid value '{digest}' for digest. Valid: sha1, sha224, sha256, "
-            "sha384, sha512, sha512_224, sha512_256, sha3_224, sha3_256, sha3_384, "
-            "sha3_512"
+            f"Invalid value '{digest}' for digest. Valid: {', '.join(_DIGESTS)}"
         )
 
     builder, key = x509util.build_csr(
@@ -320,41 +570,16 @@ def _build_csr(
         x509util.KEY_TYPE.ED25519,
         x509util.KEY_TYPE.ED448,
     ]:
-        algorithm = x509util.get_hashing_algorithm(digest)
+        algorithm = digest_cls()
     
     csr = builder.sign(key, algorithm=algorithm)
-    csr = x509util.load_csr(csr)
-    csr_encoding = getattr(serialization.Encoding, "PEM")
-    csr_bytes = csr.public_bytes(csr_encoding)
-    csr = csr_bytes.decode()
-
-    return csr
+    return csr.public_bytes(serialization.Encoding.PEM).decode()
 
 def _split_csr_kwargs(kwargs):
-    valid_csr_args = [
-        "C",
-        "ST",
-        "L",
-        "STREET",
-        "O",
-        "OU",
-        "CN",
-        "MAIL",
-        "SN",
-        "GN",
-        "UID",
-        "basicConstraints",
-        "keyUsage",
-        "subjectKeyIdentifier",
-        "authorityKeyIdentifier",
-        "certificatePolicies",
-        "policyConstraints",
-        "nameConstraints",
-    ]
     csr_args = {}
     extra_args = {}
     for k, v in kwargs.items():
-        if k in valid_csr_args:
+        if k in _VALID_CSR_ARGS:
             csr_args[k] = v
         else:
             extra_args[k] = v
@@ -1,18 +1,47 @@
 import os
 import logging
-import copy
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from cryptography import x509 as cx509
 
 from salt.exceptions import CommandExecutionError, SaltInvocationError
 from salt.state import STATE_INTERNAL_KEYWORDS as _STATE_INTERNAL_KEYWORDS
 from salt.utils import context as saltcontext
-from saltext.vault.modules import vault_pki
 
 import salt.utils.x509 as x509util
 
 log = logging.getLogger(__name__)
 
+# Parsed certificates are kept separately from the execution module's cache
+CONTEXT_KEY = "vault_pki_state"
+
+# check_cmd is a valid argument to file.managed
+_IGNORED_STATE_KWARGS = frozenset(_STATE_INTERNAL_KEYWORDS) - {"check_cmd"}
+
+_VALID_FILE_ARGS = frozenset(
+    (
+        "user",
+        "group",
+        "mode",
+        "attrs",
+        "makedirs",
+        "dir_mode",
+        "backup",
+        "create",
+        "follow_symlinks",
+        "check_cmd",
+        "tmp_dir",
+        "tmp_ext",
+        "selinux",
+        "encoding",
+        "encoding_errors",
+        "win_owner",
+        "win_perms",
+        "win_deny_perms",
+        "win_inheritance",
+        "win_perms_reset",
+    )
+)
+
 def certificate_managed(
     name,
     common_name,
@@ -28,12 +57,136 @@ def certificate_managed(
     new=False,
     **kwargs,
 ):
-    if days_valid is None:
-        days_valid = 30
+    ret, job = _check_certificate(
+        name,
+        common_name,
+        role_name,
+        days_remaining=days_remaining,
+        issuer=issuer,
+        encoding=encoding,
+        append_certs=append_certs,
+        private_key=private_key,
+        private_key_passphrase=private_key_passphrase,
+        mount_point=mount_point,
+        days_valid=days_valid,
+        new=new,
+        **kwargs,
+    )
+    if job is None:
+        return ret
 
+    try:
+        cert = None
+        if job["issue"] is not None:
+            cert = __salt__["vault_pki.issue_certificate"](**job["issue"])
+        _apply_certificate(ret, job, cert)
+    except (CommandExecutionError, SaltInvocationError) as err:
+        _fail(ret, err)
+
+    return ret
+
+def certificates_managed(name, certificates, max_workers=8, **kwargs):
+    """
+    Manage several certificates at once. The certificates that need to be
+    (re)issued are requested from Vault concurrently.
+
+    name
+        Irrelevant, not used.
+
+    certificates
+        Mapping of certificate file paths to the parameters of
+        :py:func:`certificate_managed` for each one. ``common_name``
+        and ``role_name`` are required.
+
+    max_workers
+        The maximum number of concurrent requests to Vault. Defaults to 8.
+
+    All other parameters are used as defaults for each certificate.
+    """
+    ret = {
+        "name": name,
+        "changes": {},
+        "result": True,
+        "comment": "All certificates are in the correct state",
+    }
+    rets = {}
+    jobs = {}
+    now = datetime.now(timezone.utc)
+    for path, params in certificates.items():
+        rets[path], job = _check_certificate(path, now=now, **{**kwargs, **(params or {})})
+        if job is not None:
+            jobs[path] = job
+
+    pending = [path for path, job in jobs.items() if job["issue"] is not None]
+    issued = {}
+    if pending:
+        common_names = [jobs[path]["issue"]["common_name"] for path in pending]
+        try:
+            if len(set(common_names)) == len(common_names):
+                by_cn = __salt__["vault_pki.issue_certificates"](
+                    [jobs[path]["issue"] for path in pending], max_workers=max_workers
+                )
+                issued = {path: by_cn[cn] for path, cn in zip(pending, common_names)}
+            else:
+                # The batch results are keyed by common name, which would be ambiguous
+                for path in pending:
+                    issued[path] = __salt__["vault_pki.issue_certificate"](**jobs[path]["issue"])
+        except (CommandExecutionError, SaltInvocationError) as err:
+            for path in pending:
+                if path not in issued:
+                    _fail(rets[path], err)
+                    jobs.pop(path)
+
+    for path, job in jobs.items():
+        try:
+            _apply_certificate(rets[path], job, issued.get(path))
+        except (CommandExecutionError, SaltInvocationError) as err:
+            _fail(rets[path], err)
+
+    for path, cert_ret in rets.items():
+        if cert_ret["changes"]:
+            ret["changes"][path] = cert_ret["changes"]
+        if cert_ret.get("sub_state_run"):
+            ret.setdefault("sub_state_run", []).extend(cert_ret["sub_state_run"])
+        if cert_ret["result"] is False:
+            ret["result"] = False
+        elif cert_ret["result"] is None and ret["result"] is True:
+            ret["result"] = None
+
+    if ret["changes"] or ret["result"] is not True:
+        ret["comment"] = "\n".join(
+            f"{path}: {cert_ret['comment']}" for path, cert_ret in rets.items()
+        )
+    return ret
+
+def _check_certificate(
+    name,
+    common_name,
+    role_name,
+    days_remaining=None,
+    issuer='default',
+    encoding="pem",
+    append_certs=None,
+    private_key=None,
+    private_key_passphrase=None,
+    mount_point="pki",
+    days_valid=None,
+    new=False,
+    now=None,
+    **kwargs,
+):
+    """
+    Checks the certificate without applying any changes. Returns the state
+    return and, if changes need to be applied, a description of them.
+    ``now`` allows a batch of certificates to share the reference time.
+    """
     if days_remaining is None:
         days_remaining = 7
 
+    if now is None:
+        now = datetime.now(timezone.utc)
+    expiry_cutoff = now + timedelta(days=days_remaining)
+
     ret = {
         "name": name,
         "changes": {},
@@ -58,11 +211,11 @@ def certificate_managed(
                 "comment"
             ] = "Problem while testing file.managed changes, see its output"
             _add_sub_state_run(ret, file_managed_test)
-            return ret
+            return ret, None
 
         if "is not present and is not set for creation" in file_managed_test["comment"]:
             _add_sub_state_run(ret, file_managed_test)
-            return ret
+            return ret, None
 
         real_name = os.path.realpath(name)
         replace = False
@@ -77,9 +230,7 @@ def certificate_managed(
                     current_encoding,
                     current_chain,
                     current_extra,
-                ) = x509util.load_cert(
-                    real_name, passphrase=None, get_encoding=True
-                )
+                ) = _load_current_certificate(real_name)
             except SaltInvocationError as err:
                 if any(
                     (
@@ -100,24 +251,27 @@ def certificate_managed(
                 if cn != common_name:
                     changes["common_name"] = True
 
-                if (
-                    current.not_valid_after
-                    < datetime.utcnow()
-                    + timedelta(days=days_remaining)
-                ):
+                try:
+                    not_after = current.not_valid_after_utc
+                except AttributeError:
+                    # cryptography < 42
+                    not_after = current.not_valid_after.replace(tzinfo=timezone.utc)
+                if not_after < expiry_cutoff:
                     changes["expiration"] = True
 
-                issuer_cert = vault_pki.read_issuer_certificate(issuer, mount_point=mount_point)
-                ca = x509util.load_cert(issuer_cert)
-                privKey = x509util.load_privkey(private_key, private_key_passphrase)
-
-                changes.update(
-                    _compare_cert(
-                        current,
-                        ca,
-                        privKey
+                # Any change found so far means the certificate is reissued anyways.
+                # Only verify it against the issuer and key if it would be kept.
+                if not changes and not replace:
+                    ca = _load_issuer_certificate(issuer, mount_point)
+                    privKey = x509util.load_privkey(private_key, private_key_passphrase)
+
+                    changes.update(
+                        _compare_cert(
+                            current,
+                            ca,
+                            privKey
+                        )
                     )
-                )
 
         else:
             changes["created"] = name
@@ -131,7 +285,7 @@ def certificate_managed(
             and not file_managed_test["changes"]
         ):
             _add_sub_state_run(ret, file_managed_test)
-            return ret
+            return ret, None
 
         ret["changes"] = changes
         if current and changes:
@@ -145,78 +299,104 @@ def certificate_managed(
                 else ret["comment"]
             )
             _add_sub_state_run(ret, file_managed_test)
-            return ret
-
-        if changes:
-            if not set(changes) - {
-                "additional_certs",
-            }:
-                cert = __salt__["x509.encode_certificate"](
-                        current, encoding=encoding, append_certs=append_certs
-                    )
-            else:
-                cert = vault_pki.issue_certificate(
-                    common_name=common_name,
-                    role_name=role_name,
-                    private_key=private_key,
-                    private_key_passphrase=private_key_passphrase,
-                    days_valid=days_valid,
-                    issuer=issuer,
-                    mount_point=mount_point,
-                    **cert_args
-                )
-
-            ret["comment"] = f"The certificate has been {verb}d"
-
-        if not changes or encoding in ["pem", "pkcs7_pem"]:
-            replace = bool(encoding in ["pem", "pkcs7_pem"] and changes)
-            contents = cert['certificate'] if replace else None
-            file_managed_ret = _file_managed(
-                name, contents=contents, replace=replace, **file_args
-            )
-            _add_sub_state_run(ret, file_managed_ret)
-            if not _check_file_ret(file_managed_ret, ret, current):
-                return ret
+            return ret, None
+
+        issue = None
+        if changes and set(changes) - {"additional_certs"}:
+            # Everything unknown is sent to Vault, so the local private key
+            # must not be part of this.
+            issue = {
+                "common_name": common_name,
+                "role_name": role_name,
+                "issuer": issuer,
+                "mount": mount_point,
+                **cert_args,
+            }
+            # Without it, the TTL configured on the role applies
+            if days_valid is not None:
+                issue["ttl"] = f"{days_valid * 24}h"
 
     except (CommandExecutionError, SaltInvocationError) as err:
-        ret["result"] = False
-        ret["comment"] = str(err)
-        ret["changes"] = {}
+        _fail(ret, err)
+        return ret, None
+
+    return ret, {
+        "changes": changes,
+        "current": current,
+        "verb": verb,
+        "encoding": encoding,
+        "append_certs": append_certs,
+        "file_args": file_args,
+        "issue": issue,
+    }
 
-    return ret
+def _apply_certificate(ret, job, cert):
+    """
+    Writes the certificate file as determined by :py:func:`_check_certificate`.
+    ``cert`` contains the issued certificate data, if it needed to be issued.
+    """
+    changes = job["changes"]
+    encoding = job["encoding"]
+    if changes:
+        if cert is None:
+            cert = __salt__["x509.encode_certificate"](
+                job["current"], encoding=encoding, append_certs=job["append_certs"]
+            )
+        ret["comment"] = f"The certificate has been {job['verb']}d"
+
+    if not changes or encoding in ["pem", "pkcs7_pem"]:
+        replace = bool(encoding in ["pem", "pkcs7_pem"] and changes)
+        contents = cert['certificate'] if replace else None
+        file_managed_ret = _file_managed(
+            ret["name"], contents=contents, replace=replace, **job["file_args"]
+        )
+        _add_sub_state_run(ret, file_managed_ret)
+        _check_file_ret(file_managed_ret, ret, job["current"])
+
+def _fail(ret, err):
+    ret["result"] = False
+    ret["comment"] = str(err)
+    ret["changes"] = {}
+
+def _load_issuer_certificate(issuer, mount):
+    """
+    Returns the parsed issuer certificate, which is reused for all
+    certificates signed by it.
+    """
+    pem = __salt__["vault_pki.read_issuer_certificate"](issuer, mount=mount)
+    parsed = __context__.setdefault(CONTEXT_KEY, {}).setdefault(
+        "issuer_certificate_parsed", {}
+    )
+    if pem not in parsed:
+        parsed[pem] = x509util.load_cert(pem)
+    return parsed[pem]
+
+def _load_current_certificate(path):
+    """
+    Returns the parsed certificate file, which is reused
+    as long as the file does not change.
+    """
+    stat = os.stat(path)
+    ckey = (stat.st_mtime_ns, stat.st_size)
+    parsed = __context__.setdefault(CONTEXT_KEY, {}).setdefault(
+        "certificate_parsed", {}
+    )
+    cached = parsed.get(path)
+    if cached is None or cached[0] != ckey:
+        cached = parsed[path] = (
+            ckey,
+            x509util.load_cert(path, passphrase=None, get_encoding=True),
+        )
+    return cached[1]
 
 def _filter_state_internal_kwargs(kwargs):
-    # check_cmd is a valid argument to file.managed
-    ignore = set(_STATE_INTERNAL_KEYWORDS) - {"check_cmd"}
-    return {k: v for k, v in kwargs.items() if k not in ignore}
+    return {k: v for k, v in kwargs.items() if k not in _IGNORED_STATE_KWARGS}
 
 def _split_file_kwargs(kwargs):
-    valid_file_args = [
-        "user",
-        "group",
-        "mode",
-        "attrs",
-        "makedirs",
-        "dir_mode",
-        "backup",
-        "create",
-        "follow_symlinks",
-        "check_cmd",
-        "tmp_dir",
-        "tmp_ext",
-        "selinux",
-        "encoding",
-        "encoding_errors",
-        "win_owner",
-        "win_perms",
-        "win_deny_perms",
-        "win_inheritance",
-        "win_perms_reset",
-    ]
     file_args = {"show_changes": False}
     extra_args = {}
     for k, v in kwargs.items():
-        if k in valid_file_args:
+        if k in _VALID_FILE_ARGS:
             file_args[k] = v
         else:
             extra_args[k] = v
@@ -237,7 +417,8 @@ def _file_managed(name, test=None, **kwargs):
     if test not in [None, True]:
         raise SaltInvocationError("test param can only be None or True")
     # work around https://github.com/saltstack/salt/issues/62590
-    opts = copy.deepcopy(__opts__)
+    # Only the top-level test flag differs, a shallow copy is sufficient.
+    opts = dict(__opts__)
     opts['test'] = test or __opts__["test"]
 
     file_managed = __states__["file.managed"]
@@ -268,8 +449,10 @@ def _compare_cert(current, signing_cert : cx509.Certificate, private_key):
         changes["signing_private_key"] = True
 
     # Check correctly if issuer is the same
-    if _getattr_safe(signing_cert, "issuer") != current.issuer:
-        changes["issuer_name"] = _getattr_safe(signing_cert, "issuer").rfc4514_string()
+    if signing_cert:
+        sc_issuer = _getattr_safe(signing_cert, "issuer")
+        if sc_issuer != current.issuer:
+            changes["issuer_name"] = sc_issuer.rfc4514_string()
 
     if not x509util.is_pair(
         current.public_key(), private_key
@@ -9,7 +9,6 @@ import salt.exceptions
 import salt.utils.data
 import salt.utils.dictupdate
 import salt.utils.json
-import salt.utils.versions
 import saltext.vault.utils.vault.helpers as hlp
 from saltext.vault.utils.vault.auth import InvalidVaultSecretId
 from saltext.vault.utils.vault.auth import InvalidVaultToken
@@ -27,6 +26,7 @@ from saltext.vault.utils.vault.exceptions import VaultUnavailableError
 from saltext.vault.utils.vault.exceptions import VaultUnsupportedOperationError
 from saltext.vault.utils.vault.exceptions import VaultUnwrapException
 from saltext.vault.utils.vault.factory import clear_cache
+from saltext.vault.utils.vault.factory import close_session
 from saltext.vault.utils.vault.factory import get_authd_client
 from saltext.vault.utils.vault.factory import get_kv
 from saltext.vault.utils.vault.factory import get_lease_store
@@ -37,7 +37,6 @@ from saltext.vault.utils.vault.leases import VaultToken
 from saltext.vault.utils.vault.leases import VaultWrappedResponse
 
 log = logging.getLogger(__name__)
-logging.getLogger("requests").setLevel(logging.WARNING)
 
 
 def query(
@@ -1,6 +1,7 @@
 """
 Vault API client implementation
 """
+import functools
 import logging
 import re
 
@@ -19,7 +20,6 @@ from saltext.vault.utils.vault.exceptions import VaultUnsupportedOperationError
 from saltext.vault.utils.vault.exceptions import VaultUnwrapException
 
 log = logging.getLogger(__name__)
-logging.getLogger("requests").setLevel(logging.WARNING)
 
 # This list is not complete at all, but contains
 # the most important paths.
@@ -38,18 +38,16 @@ def _get_expected_creation_path(secret_type, config=None):
 
     if secret_type == "secret_id":
         if config is not None:
-            mount, approle = re.escape(config["auth"]["approle_mount"]), re.escape(
-                config["auth"]["approle_name"]
+            return _get_approle_creation_path(
+                r"secret\-id", config["auth"]["approle_mount"], config["auth"]["approle_name"]
             )
-            return rf"auth/{mount}/role/{approle}/secret\-id"
         return r"auth/[^/]+/role/[^/]+/secret\-id"
 
     if secret_type == "role_id":
         if config is not None:
-            mount, approle = re.escape(config["auth"]["approle_mount"]), re.escape(
-                config["auth"]["approle_name"]
+            return _get_approle_creation_path(
+                r"role\-id", config["auth"]["approle_mount"], config["auth"]["approle_name"]
             )
-            return rf"auth/{mount}/role/{approle}/role\-id"
         return r"auth/[^/]+/role/[^/]+/role\-id"
 
     raise salt.exceptions.SaltInvocationError(
@@ -57,6 +55,21 @@ def _get_expected_creation_path(secret_type, config=None):
     )
 
 
+@functools.lru_cache(maxsize=32)
+def _get_approle_creation_path(endpoint, mount, approle):
+    # The configured AppRole rarely changes, so avoid escaping it on every request
+    return rf"auth/{re.escape(mount)}/role/{re.escape(approle)}/{endpoint}"
+
+
+@functools.lru_cache(maxsize=None)
+def _configure_requests_logging():
+    """
+    Silence the requests logger once, when a client is first created,
+    instead of on every (re)import of the module.
+    """
+    logging.getLogger("requests").setLevel(logging.WARNING)
+
+
 class VaultClient:
     """
     Unauthenticated client for the Vault API.
@@ -64,6 +77,7 @@ class VaultClient:
     """
 
     def __init__(self, url, namespace=None, verify=None, session=None):
+        _configure_requests_logging()
         self.url = url
         self.namespace = namespace
         self.verify = verify
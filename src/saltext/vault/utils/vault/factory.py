@@ -1,20 +1,19 @@
 """
 Salt-Vault integration core functions
 """
-import base64
 import copy
 import logging
+from binascii import b2a_base64
+from types import MappingProxyType
 
 import salt.cache
 import salt.crypt
 import salt.exceptions
-import salt.modules.publish
-import salt.modules.saltutil
 import salt.utils.context
 import salt.utils.data
 import salt.utils.dictupdate
+import salt.utils.event
 import salt.utils.json
-import salt.utils.versions
 import saltext.vault.utils.vault.api as vapi
 import saltext.vault.utils.vault.auth as vauth
 import saltext.vault.utils.vault.cache as vcache
@@ -31,11 +30,105 @@ from saltext.vault.utils.vault.exceptions import VaultPermissionDeniedError
 from saltext.vault.utils.vault.exceptions import VaultUnwrapException
 
 log = logging.getLogger(__name__)
-logging.getLogger("requests").setLevel(logging.WARNING)
 
 
 TOKEN_CKEY = "__token"
 CLIENT_CKEY = "_vault_authd_client"
+UNAUTHD_CLIENT_CKEY = "_vault_unauthd_client"
+
+# Read-only defaults for lookups, avoids allocating throwaway containers
+_EMPTY = MappingProxyType({})
+_EMPTY_LIST = ()
+
+_DEFAULT_CONFIG = {
+    "auth": {
+        "approle_mount": "approle",
+        "approle_name": "salt-master",
+        "method": "token",
+        "secret_id": None,
+        "token_lifecycle": {
+            "minimum_ttl": 10,
+            "renew_increment": None,
+        },
+    },
+    "cache": {
+        "backend": "session",
+        "clear_attempt_revocation": 60,
+        "clear_on_unauthorized": True,
+        "config": 3600,
+        "expire_events": False,
+        "kv_metadata": "connection",
+        "secret": "ttl",
+    },
+    "issue": {
+        "allow_minion_override_params": False,
+        "type": "token",
+        "approle": {
+            "mount": "salt-minions",
+            "params": {
+                "bind_secret_id": True,
+                "secret_id_num_uses": 1,
+                "secret_id_ttl": 60,
+                "token_explicit_max_ttl": 60,
+                "token_num_uses": 10,
+            },
+        },
+        "token": {
+            "role_name": None,
+            "params": {
+                "explicit_max_ttl": None,
+                "num_uses": 1,
+            },
+        },
+        "wrap": "30s",
+    },
+    "issue_params": {},
+    "metadata": {
+        "entity": {
+            "minion-id": "{minion}",
+        },
+        "secret": {
+            "saltstack-jid": "{jid}",
+            "saltstack-minion": "{minion}",
+            "saltstack-user": "{user}",
+        },
+    },
+    "policies": {
+        "assign": [
+            "saltstack/minions",
+            "saltstack/{minion}",
+        ],
+        "cache_time": 60,
+        "refresh_pillar": None,
+    },
+    "server": {
+        "namespace": None,
+        "verify": None,
+    },
+}
+
+# Translation of the old configuration format: old key -> new key(s)
+_LEGACY_CONFIG_KEYS = tuple(
+    (tuple(old.split(":")), tuple(tuple(new.split(":")) for new in news))
+    for old, news in (
+        # ttl, uses were used as configuration for issuance and minion overrides as well
+        # as token meta information. The new configuration splits those semantics.
+        ("auth:ttl", ("issue:token:params:explicit_max_ttl", "issue_params:explicit_max_ttl")),
+        ("auth:uses", ("issue:token:params:num_uses", "issue_params:num_uses")),
+        # Those were found in the root namespace, but grouping them together
+        # makes semantic and practical sense.
+        ("namespace", ("server:namespace",)),
+        ("url", ("server:url",)),
+        ("verify", ("server:verify",)),
+        ("role_name", ("issue:token:role_name",)),
+        ("auth:token_backend", ("cache:backend",)),
+        ("auth:allow_minion_override", ("issue:allow_minion_override_params",)),
+    )
+)
+
+# The signed payload is only the minion ID, so the signature
+# does not need to be recomputed for each request.
+_SIGNATURE_CACHE = {}
 
 
 def get_authd_client(opts, context, force_local=False, get_config=False):
@@ -63,13 +156,14 @@ def get_authd_client(opts, context, force_local=False, get_config=False):
 
     # First, check if an already initialized instance is available
     # and still valid
-    if cbank in context and CLIENT_CKEY in context[cbank]:
+    bucket = context.get(cbank)
+    if bucket is not None and CLIENT_CKEY in bucket:
         log.debug("Fetching client instance and config from context")
-        client, config = context[cbank][CLIENT_CKEY]
+        client, config = bucket[CLIENT_CKEY]
         if not client.token_valid(remote=False):
             log.debug("Cached client instance was invalid")
             client = config = None
-            context[cbank].pop(CLIENT_CKEY)
+            bucket.pop(CLIENT_CKEY)
 
     # Otherwise, try to build one from possibly cached data
     if client is None or config is None:
@@ -79,45 +173,44 @@ def get_authd_client(opts, context, force_local=False, get_config=False):
             clear_cache(opts, context, session=True, force_local=force_local)
             client, config, retry = try_build()
 
-    # Check if the token needs to be and can be renewed.
-    # Since this needs to check the possibly active session and does not care
-    # about valid SecretIDs etc, we need to inspect the actual token.
-    if (
-        not retry
-        and config["auth"]["token_lifecycle"]["renew_increment"] is not False
-        and client.auth.get_token().is_renewable()
-        and not client.auth.get_token().is_valid(config["auth"]["token_lifecycle"]["minimum_ttl"])
-    ):
-        log.debug("Renewing token")
-        client.token_renew(increment=config["auth"]["token_lifecycle"]["renew_increment"])
-
-    # Check if the current token could not be renewed for a sufficient amount of time.
-    if not retry and not client.token_valid(
-        config["auth"]["token_lifecycle"]["minimum_ttl"] or 0, remote=False
-    ):
-        clear_cache(opts, context, session=True, force_local=force_local)
-        client, config, retry = try_build()
+    if not retry:
+        token_lifecycle = config["auth"]["token_lifecycle"]
+        minimum_ttl = token_lifecycle["minimum_ttl"] or 0
+        renew_increment = token_lifecycle["renew_increment"]
+        # Check if the token needs to be and can be renewed.
+        # Since this needs to check the possibly active session and does not care
+        # about valid SecretIDs etc, we need to inspect the actual token.
+        if renew_increment is not False:
+            token = client.auth.get_token()
+            if token.is_renewable() and not token.is_valid(minimum_ttl):
+                log.debug("Renewing token")
+                client.token_renew(increment=renew_increment)
+
+        # Check if the current token could not be renewed for a sufficient amount of time.
+        if not client.token_valid(minimum_ttl, remote=False):
+            clear_cache(opts, context, session=True, force_local=force_local)
+            client, config, retry = try_build()
 
     if retry:
         log.debug("Requesting new authentication credentials")
         try:
-            client, config = _build_authd_client(opts, context, force_local=force_local)
+            # The connection cache was just cleared, so probing it is pointless
+            client, config = _build_authd_client(
+                opts, context, force_local=force_local, skip_cache_probe=True
+            )
         except VaultUnwrapException as err:
             _get_event(opts)(tag="vault/security/unwrapping/error", data=err.event_data)
             raise
-        if not client.token_valid(
-            config["auth"]["token_lifecycle"]["minimum_ttl"] or 0, remote=False
-        ):
-            if not config["auth"]["token_lifecycle"]["minimum_ttl"]:
+        minimum_ttl = config["auth"]["token_lifecycle"]["minimum_ttl"] or 0
+        if not client.token_valid(minimum_ttl, remote=False):
+            if not minimum_ttl:
                 raise VaultException("Could not build valid client. This is most likely a bug.")
             log.warning(
                 "Configuration error: auth:token_lifecycle:minimum_ttl cannot be "
                 "honored because fresh tokens are issued with less ttl. Continuing anyways."
             )
 
-    if cbank not in context:
-        context[cbank] = {}
-    context[cbank][CLIENT_CKEY] = (client, config)
+    context.setdefault(cbank, {})[CLIENT_CKEY] = (client, config)
 
     if get_config:
         return client, config
@@ -182,10 +275,8 @@ def clear_cache(opts, context, ckey=None, connection=True, session=False, force_
         if config:
             try:
                 # Don't revoke the only token that is available to us
-                if config["auth"]["method"] != "token" or not (
-                    force_local
-                    or hlp._get_salt_run_type(opts)
-                    in (hlp.SALT_RUNTYPE_MASTER, hlp.SALT_RUNTYPE_MINION_LOCAL)
+                if config["auth"]["method"] != "token" or not _config_is_local(
+                    opts, force_local=force_local
                 ):
                     if config["cache"]["clear_attempt_revocation"]:
                         delta = config["cache"]["clear_attempt_revocation"]
@@ -234,6 +325,39 @@ def clear_cache(opts, context, ckey=None, connection=True, session=False, force_
     return cache.flush(cbank, ckey)
 
 
+def close_session(opts, context, force_local=False):
+    """
+    Close the HTTP connections of the Vault clients cached in ``__context__``.
+    The clients themselves are kept and reconnect on their next request.
+    Returns whether a cached client was found.
+
+    opts
+        Pass __opts__.
+
+    context
+        Pass __context__.
+
+    force_local
+        Close the connections of the clients using the local configuration,
+        regardless of determined run type. Defaults to false.
+    """
+    bucket = context.get(vcache._get_cache_bank(opts, force_local=force_local))
+    if not bucket:
+        return False
+    clients = []
+    if CLIENT_CKEY in bucket:
+        clients.append(bucket[CLIENT_CKEY][0])
+    if UNAUTHD_CLIENT_CKEY in bucket:
+        clients.append(bucket[UNAUTHD_CLIENT_CKEY])
+    closed = []
+    for client in clients:
+        # The authenticated client usually shares the session of the unauthenticated one
+        if client.session not in closed:
+            client.session.close()
+            closed.append(client.session)
+    return bool(clients)
+
+
 def update_config(opts, context, keep_session=False):
     """
     Attempt to update the cached configuration without
@@ -253,10 +377,7 @@ def update_config(opts, context, keep_session=False):
         significantly.
         Defaults to False.
     """
-    if hlp._get_salt_run_type(opts) in (
-        hlp.SALT_RUNTYPE_MASTER,
-        hlp.SALT_RUNTYPE_MINION_LOCAL,
-    ):
+    if _config_is_local(opts):
         # local configuration is not cached
         return True
     connection_cbank = vcache._get_cache_bank(opts)
@@ -272,7 +393,7 @@ def update_config(opts, context, keep_session=False):
     return True
 
 
-def _build_authd_client(opts, context, force_local=False):
+def _build_authd_client(opts, context, force_local=False, skip_cache_probe=False):
     connection_cbank = vcache._get_cache_bank(opts, force_local=force_local)
     config, embedded_token, unauthd_client = _get_connection_config(
         connection_cbank, opts, context, force_local=force_local
@@ -294,7 +415,7 @@ def _build_authd_client(opts, context, force_local=False):
 
     if config["auth"]["method"] == "approle":
         secret_id = config["auth"]["secret_id"] or None
-        cached_token = token_cache.get(10)
+        cached_token = None if skip_cache_probe else token_cache.get(10)
         secret_id_cache = None
         if secret_id:
             secret_id_cache = vcache.VaultAuthCache(
@@ -305,7 +426,7 @@ def _build_authd_client(opts, context, force_local=False):
                 cache_backend=vcache._get_cache_backend(config, opts),
                 ttl=cache_ttl,
             )
-            secret_id = secret_id_cache.get()
+            secret_id = None if skip_cache_probe else secret_id_cache.get()
             # Only fetch SecretID if there is no cached valid token
             if cached_token is None and secret_id is None:
                 secret_id = _fetch_secret_id(
@@ -314,16 +435,13 @@ def _build_authd_client(opts, context, force_local=False):
                     secret_id_cache,
                     unauthd_client,
                     force_local=force_local,
+                    skip_cache_probe=skip_cache_probe,
                 )
             if secret_id is None:
                 # If the auth config is sourced locally, ensure the
                 # SecretID is known regardless whether we have a valid token.
                 # For remote sources, we would needlessly request one, so don't.
-                if (
-                    hlp._get_salt_run_type(opts)
-                    in (hlp.SALT_RUNTYPE_MASTER, hlp.SALT_RUNTYPE_MINION_LOCAL)
-                    or force_local
-                ):
+                if _config_is_local(opts, force_local=force_local):
                     secret_id = _fetch_secret_id(
                         config, opts, secret_id_cache, unauthd_client, force_local=force_local
                     )
@@ -353,6 +471,7 @@ def _build_authd_client(opts, context, force_local=False):
             unauthd_client,
             force_local=force_local,
             embedded_token=embedded_token,
+            skip_cache_probe=skip_cache_probe,
         )
         auth = vauth.VaultTokenAuth(token=token, cache=token_cache)
         client = vclient.AuthenticatedVaultClient(
@@ -400,13 +519,22 @@ def _build_revocation_client(opts, context, force_local=False):
     return client, config
 
 
+def _config_is_local(opts, force_local=False):
+    """
+    Whether the Vault configuration is sourced from the local opts
+    instead of being requested from the master.
+    """
+    # force_local is checked first to avoid inspecting opts needlessly
+    return force_local or hlp._get_salt_run_type(opts) in (
+        hlp.SALT_RUNTYPE_MASTER,
+        hlp.SALT_RUNTYPE_MINION_LOCAL,
+    )
+
+
 def _get_connection_config(cbank, opts, context, force_local=False, pre_flush=False, update=False):
-    if (
-        hlp._get_salt_run_type(opts) in (hlp.SALT_RUNTYPE_MASTER, hlp.SALT_RUNTYPE_MINION_LOCAL)
-        or force_local
-    ):
+    if _config_is_local(opts, force_local=force_local):
         # only cache config fetched from remote
-        return _use_local_config(opts)
+        return _use_local_config(opts, context, cbank)
 
     if pre_flush and update:
         raise VaultException("`pre_flush` and `update` are mutually exclusive")
@@ -422,7 +550,7 @@ def _get_connection_config(cbank, opts, context, force_local=False, pre_flush=Fa
     config = config_cache.get()
     if config is not None and not update:
         log.debug("Using cached Vault server connection configuration.")
-        return config, None, vclient.VaultClient(**config["server"])
+        return config, None, _get_unauthd_client(config["server"], context, cbank)
 
     if pre_flush:
         # used when building a client that revokes leases before clearing cache
@@ -430,11 +558,11 @@ def _get_connection_config(cbank, opts, context, force_local=False, pre_flush=Fa
 
     log.debug("Using new Vault server connection configuration.")
     try:
-        issue_params = parse_config(opts.get("vault", {}), validate=False)["issue_params"]
+        issue_params = _get_issue_params(opts)
         new_config, unwrap_client = _query_master(
             "get_config",
             opts,
-            issue_params=issue_params or None,
+            issue_params=issue_params,
             config_only=update,
         )
     except VaultConfigExpired as err:
@@ -448,8 +576,8 @@ def _get_connection_config(cbank, opts, context, force_local=False, pre_flush=Fa
         new_config, unwrap_client = _query_master(
             "generate_token",
             opts,
-            ttl=issue_params.get("explicit_max_ttl"),
-            uses=issue_params.get("num_uses"),
+            ttl=(issue_params or {}).get("explicit_max_ttl"),
+            uses=(issue_params or {}).get("num_uses"),
             upgrade_request=True,
         )
     new_config = parse_config(new_config, opts=opts, require_token=not update)
@@ -480,7 +608,7 @@ def _get_connection_config(cbank, opts, context, force_local=False, pre_flush=Fa
     return new_config, embedded_token, unwrap_client
 
 
-def _use_local_config(opts):
+def _use_local_config(opts, context, cbank):
     log.debug("Using Vault connection details from local config.")
     config = parse_config(opts.get("vault", {}))
     embedded_token = config["auth"].pop("token", None)
@@ -491,15 +619,31 @@ def _use_local_config(opts):
             "server": config["server"],
         },
         embedded_token,
-        vclient.VaultClient(**config["server"]),
+        _get_unauthd_client(config["server"], context, cbank),
     )
 
 
-def _fetch_secret_id(config, opts, secret_id_cache, unwrap_client, force_local=False):
+def _get_unauthd_client(server_config, context, cbank):
+    """
+    Reuses the unauthenticated client and thus its HTTP session
+    as long as the server configuration does not change.
+    """
+    bucket = context.setdefault(cbank, {})
+    client = bucket.get(UNAUTHD_CLIENT_CKEY)
+    if client is None or client.get_config() != server_config:
+        client = vclient.VaultClient(**server_config)
+        bucket[UNAUTHD_CLIENT_CKEY] = client
+    return client
+
+
+def _fetch_secret_id(
+    config, opts, secret_id_cache, unwrap_client, force_local=False, skip_cache_probe=False
+):
     def cache_or_fetch(config, opts, secret_id_cache, unwrap_client):
-        secret_id = secret_id_cache.get()
-        if secret_id is not None:
-            return secret_id
+        if not skip_cache_probe:
+            secret_id = secret_id_cache.get()
+            if secret_id is not None:
+                return secret_id
 
         log.debug("Fetching new Vault AppRole secret ID.")
         secret_id, _ = _query_master(
@@ -507,8 +651,7 @@ def _fetch_secret_id(config, opts, secret_id_cache, unwrap_client, force_local=F
             opts,
             unwrap_client=unwrap_client,
             unwrap_expected_creation_path=vclient._get_expected_creation_path("secret_id", config),
-            issue_params=parse_config(opts.get("vault", {}), validate=False)["issue_params"]
-            or None,
+            issue_params=_get_issue_params(opts),
         )
         secret_id = vleases.VaultSecretId(**secret_id["data"])
         # Do not cache single-use SecretIDs
@@ -516,10 +659,7 @@ def _fetch_secret_id(config, opts, secret_id_cache, unwrap_client, force_local=F
             secret_id_cache.store(secret_id)
         return secret_id
 
-    if (
-        hlp._get_salt_run_type(opts) in (hlp.SALT_RUNTYPE_MASTER, hlp.SALT_RUNTYPE_MINION_LOCAL)
-        or force_local
-    ):
+    if _config_is_local(opts, force_local=force_local):
         secret_id = config["auth"]["secret_id"]
         if isinstance(secret_id, dict):
             if secret_id.get("wrap_info"):
@@ -544,9 +684,17 @@ def _fetch_secret_id(config, opts, secret_id_cache, unwrap_client, force_local=F
     return cache_or_fetch(config, opts, secret_id_cache, unwrap_client)
 
 
-def _fetch_token(config, opts, token_cache, unwrap_client, force_local=False, embedded_token=None):
+def _fetch_token(
+    config,
+    opts,
+    token_cache,
+    unwrap_client,
+    force_local=False,
+    embedded_token=None,
+    skip_cache_probe=False,
+):
     def cache_or_fetch(config, opts, token_cache, unwrap_client, embedded_token):
-        token = token_cache.get(10)
+        token = None if skip_cache_probe else token_cache.get(10)
         if token is not None:
             log.debug("Using cached token.")
             return token
@@ -561,8 +709,7 @@ def _fetch_token(config, opts, token_cache, unwrap_client, force_local=False, em
                 opts,
                 unwrap_client=unwrap_client,
                 unwrap_expected_creation_path=vclient._get_expected_creation_path("token", config),
-                issue_params=parse_config(opts.get("vault", {}), validate=False)["issue_params"]
-                or None,
+                issue_params=_get_issue_params(opts),
             )
             token = vleases.VaultToken(**token["auth"])
 
@@ -571,48 +718,60 @@ def _fetch_token(config, opts, token_cache, unwrap_client, force_local=False, em
             token_cache.store(token)
         return token
 
-    if (
-        hlp._get_salt_run_type(opts) in (hlp.SALT_RUNTYPE_MASTER, hlp.SALT_RUNTYPE_MINION_LOCAL)
-        or force_local
-    ):
-        token = None
-        if isinstance(embedded_token, dict):
-            if embedded_token.get("wrap_info"):
-                embedded_token = unwrap_client.unwrap(
-                    embedded_token["wrap_info"]["token"],
-                    expected_creation_path=vclient._get_expected_creation_path("token", config),
-                )["auth"]
-            token = vleases.VaultToken(**embedded_token)
-        elif config["auth"]["method"] == "wrapped_token":
+    if _config_is_local(opts, force_local=force_local):
+        return _resolve_local_token(config, embedded_token, unwrap_client, token_cache)
+
+    log.debug("Using token generated by master.")
+    return cache_or_fetch(config, opts, token_cache, unwrap_client, embedded_token)
+
+
+def _resolve_local_token(config, embedded_token, unwrap_client, token_cache):
+    """
+    Returns the token from the local configuration, unwrapping or
+    verifying it as needed.
+    """
+    if isinstance(embedded_token, dict):
+        if embedded_token.get("wrap_info"):
             embedded_token = unwrap_client.unwrap(
-                embedded_token,
+                embedded_token["wrap_info"]["token"],
                 expected_creation_path=vclient._get_expected_creation_path("token", config),
             )["auth"]
-            token = vleases.VaultToken(**embedded_token)
-        elif embedded_token is not None:
-            # if the embedded plain token info has been cached before, don't repeat
-            # the query unnecessarily
-            token = token_cache.get()
-            if token is None or embedded_token != str(token):
-                # lookup and verify raw token
-                token_info = unwrap_client.token_lookup(embedded_token, raw=True)
-                if token_info.status_code != 200:
-                    raise VaultException(
-                        "Configured token cannot be verified. It is most likely expired or invalid."
-                    )
-                token_meta = token_info.json()["data"]
-                token = vleases.VaultToken(
-                    lease_id=embedded_token,
-                    lease_duration=token_meta["ttl"],
-                    **token_meta,
-                )
-                token_cache.store(token)
-        if token is not None:
-            return token
+        return vleases.VaultToken(**embedded_token)
+    if config["auth"]["method"] == "wrapped_token":
+        embedded_token = unwrap_client.unwrap(
+            embedded_token,
+            expected_creation_path=vclient._get_expected_creation_path("token", config),
+        )["auth"]
+        return vleases.VaultToken(**embedded_token)
+    if embedded_token is None:
         raise VaultException("Invalid configuration, missing token.")
+    # if the embedded plain token info has been cached before, don't repeat
+    # the query unnecessarily
+    token = token_cache.get()
+    if token is not None and embedded_token == str(token):
+        return token
+    # lookup and verify raw token
+    token_info = unwrap_client.token_lookup(embedded_token, raw=True)
+    if token_info.status_code != 200:
+        raise VaultException(
+            "Configured token cannot be verified. It is most likely expired or invalid."
+        )
+    token_meta = token_info.json()["data"]
+    token = vleases.VaultToken(
+        lease_id=embedded_token,
+        lease_duration=token_meta["ttl"],
+        **token_meta,
+    )
+    token_cache.store(token)
+    return token
 
-    log.debug("Using token generated by master.")
-    return cache_or_fetch(config, opts, token_cache, unwrap_client, embedded_token)
+
+def _get_issue_params(opts):
+    vault_config = opts.get("vault", _EMPTY)
+    if any(legacy in vault_config.get("auth", _EMPTY) for legacy in ("ttl", "uses")):
+        # The old configuration format needs to be translated
+        return parse_config(vault_config, validate=False)["issue_params"] or None
+    return vault_config.get("issue_params") or None
 
 
 def _query_master(
@@ -663,8 +822,7 @@ def _query_master(
         if "server" in result:
             # Ensure locally overridden verify parameter does not
             # always invalidate cache.
-            reported_server = parse_config(result["server"], validate=False, opts=opts)["server"]
-            result.update({"server": reported_server})
+            result.update({"server": _normalize_server(result["server"], opts)})
 
         if unwrap_client is not None:
             expected_server = unwrap_client.get_config()
@@ -678,17 +836,19 @@ def _query_master(
 
         # This is used to augment some vault responses with data fetched by the master
         # e.g. secret_id_num_uses
-        misc_data = result.get("misc_data", {})
+        misc_data = result.get("misc_data", _EMPTY)
 
         if result.get("wrap_info") or result.get("wrap_info_nested"):
             if unwrap_client is None:
                 unwrap_client = vclient.VaultClient(**result["server"])
 
-            for key in [""] + result.get("wrap_info_nested", []):
-                if key:
-                    wrapped = salt.utils.data.traverse_dict(result, key)
-                else:
+            for key in ("", *result.get("wrap_info_nested", _EMPTY_LIST)):
+                if not key:
                     wrapped = result
+                elif ":" not in key:
+                    wrapped = result.get(key)
+                else:
+                    wrapped = salt.utils.data.traverse_dict(result, key)
                 if not wrapped or "wrap_info" not in wrapped:
                     continue
                 wrapped_response = vleases.VaultWrappedResponse(**wrapped["wrap_info"])
@@ -701,11 +861,11 @@ def _query_master(
                     err.event_data.update({"func": f"vault.{func}"})
                     raise
                 if key:
-                    salt.utils.dictupdate.set_dict_key_value(
-                        result,
-                        key,
-                        unwrapped_response.get("auth") or unwrapped_response.get("data"),
-                    )
+                    unwrapped = unwrapped_response.get("auth") or unwrapped_response.get("data")
+                    if ":" not in key:
+                        result[key] = unwrapped
+                    else:
+                        salt.utils.dictupdate.set_dict_key_value(result, key, unwrapped)
                 else:
                     if unwrapped_response.get("auth"):
                         result.update({"auth": unwrapped_response["auth"]})
@@ -715,9 +875,12 @@ def _query_master(
         if config_expired:
             raise VaultConfigExpired()
 
+        tgt = "data" if result.get("data") is not None else "auth"
         for key, val in misc_data.items():
-            tgt = "data" if result.get("data") is not None else "auth"
-            if salt.utils.data.traverse_dict_and_list(result, f"{tgt}:{key}", NOT_SET) == NOT_SET:
+            container = result.get(tgt)
+            if ":" not in key and isinstance(container, dict):
+                container.setdefault(key, val)
+            elif salt.utils.data.traverse_dict_and_list(result, f"{tgt}:{key}", NOT_SET) == NOT_SET:
                 salt.utils.dictupdate.set_dict_key_value(
                     result,
                     f"{tgt}:{key}",
@@ -734,24 +897,30 @@ def _query_master(
 
     # When rendering pillars, the module executes on the master, but the token
     # should be issued for the minion, so that the correct policies are applied
+    # The execution modules are imported lazily since they are heavy
+    # and only needed when the configuration is not sourced locally.
     if opts.get("__role", "minion") == "minion":
+        from salt.modules import publish
+
         private_key = f"{pki_dir}/minion.pem"
         log.debug(
             "Running on minion, signing request `vault.%s` with key %s",
             func,
             private_key,
         )
-        signature = base64.b64encode(salt.crypt.sign_message(private_key, minion_id))
+        signature = _sign_minion_id(private_key, minion_id)
         arg = [
             ("minion_id", minion_id),
             ("signature", signature),
             ("impersonated_by_master", False),
         ] + list(kwargs.items())
-        with salt.utils.context.func_globals_inject(salt.modules.publish.runner, __opts__=opts):
-            result = salt.modules.publish.runner(
+        with salt.utils.context.func_globals_inject(publish.runner, __opts__=opts):
+            result = publish.runner(
                 f"vault.{func}", arg=[{"__kwarg__": True, k: v} for k, v in arg]
             )
     else:
+        from salt.modules import saltutil
+
         private_key = f"{pki_dir}/master.pem"
         log.debug(
             "Running on master, signing request `vault.%s` for %s with key %s",
@@ -759,9 +928,9 @@ def _query_master(
             minion_id,
             private_key,
         )
-        signature = base64.b64encode(salt.crypt.sign_message(private_key, minion_id))
-        with salt.utils.context.func_globals_inject(salt.modules.saltutil.runner, __opts__=opts):
-            result = salt.modules.saltutil.runner(
+        signature = _sign_minion_id(private_key, minion_id)
+        with salt.utils.context.func_globals_inject(saltutil.runner, __opts__=opts):
+            result = saltutil.runner(
                 f"vault.{func}",
                 minion_id=minion_id,
                 signature=signature,
@@ -775,6 +944,15 @@ def _query_master(
     )
 
 
+def _sign_minion_id(private_key, minion_id):
+    ckey = (private_key, minion_id)
+    if ckey not in _SIGNATURE_CACHE:
+        _SIGNATURE_CACHE[ckey] = b2a_base64(
+            salt.crypt.sign_message(private_key, minion_id), newline=False
+        )
+    return _SIGNATURE_CACHE[ckey]
+
+
 def _get_event(opts):
     event = salt.utils.event.get_event(
         opts.get("__role", "minion"), sock_dir=opts["sock_dir"], opts=opts, listen=False
@@ -860,113 +1038,26 @@ def parse_config(config, validate=True, opts=None, require_token=True):
     Returns a vault configuration dictionary that has all
     keys with defaults. Checks if required data is available.
     """
-    default_config = {
-        "auth": {
-            "approle_mount": "approle",
-            "approle_name": "salt-master",
-            "method": "token",
-            "secret_id": None,
-            "token_lifecycle": {
-                "minimum_ttl": 10,
-                "renew_increment": None,
-            },
-        },
-        "cache": {
-            "backend": "session",
-            "clear_attempt_revocation": 60,
-            "clear_on_unauthorized": True,
-            "config": 3600,
-            "expire_events": False,
-            "kv_metadata": "connection",
-            "secret": "ttl",
-        },
-        "issue": {
-            "allow_minion_override_params": False,
-            "type": "token",
-            "approle": {
-                "mount": "salt-minions",
-                "params": {
-                    "bind_secret_id": True,
-                    "secret_id_num_uses": 1,
-                    "secret_id_ttl": 60,
-                    "token_explicit_max_ttl": 60,
-                    "token_num_uses": 10,
-                },
-            },
-            "token": {
-                "role_name": None,
-                "params": {
-                    "explicit_max_ttl": None,
-                    "num_uses": 1,
-                },
-            },
-            "wrap": "30s",
-        },
-        "issue_params": {},
-        "metadata": {
-            "entity": {
-                "minion-id": "{minion}",
-            },
-            "secret": {
-                "saltstack-jid": "{jid}",
-                "saltstack-minion": "{minion}",
-                "saltstack-user": "{user}",
-            },
-        },
-        "policies": {
-            "assign": [
-                "saltstack/minions",
-                "saltstack/{minion}",
-            ],
-            "cache_time": 60,
-            "refresh_pillar": None,
-        },
-        "server": {
-            "namespace": None,
-            "verify": None,
-        },
-    }
     # Policy generation has params, the new config groups them together.
-    if isinstance(config.get("policies", {}), list):
+    if isinstance(config.get("policies"), list):
         config["policies"] = {"assign": config.pop("policies")}
+    # merge deepcopies the defaults, so the shared template is never mutated
     merged = salt.utils.dictupdate.merge(
-        default_config,
+        _DEFAULT_CONFIG,
         config,
         strategy="smart",
         merge_lists=False,
     )
-    # ttl, uses were used as configuration for issuance and minion overrides as well
-    # as token meta information. The new configuration splits those semantics.
-    for old_token_conf, new_token_conf in (
-        ("ttl", "explicit_max_ttl"),
-        ("uses", "num_uses"),
-    ):
-        if old_token_conf in merged["auth"]:
-            merged["issue"]["token"]["params"][new_token_conf] = merged["issue_params"][
-                new_token_conf
-            ] = merged["auth"].pop(old_token_conf)
-    # Those were found in the root namespace, but grouping them together
-    # makes semantic and practical sense.
-    for old_server_conf in ("namespace", "url", "verify"):
-        if old_server_conf in merged:
-            merged["server"][old_server_conf] = merged.pop(old_server_conf)
-    if "role_name" in merged:
-        merged["issue"]["token"]["role_name"] = merged.pop("role_name")
-    if "token_backend" in merged["auth"]:
-        merged["cache"]["backend"] = merged["auth"].pop("token_backend")
-    if "allow_minion_override" in merged["auth"]:
-        merged["issue"]["allow_minion_override_params"] = merged["auth"].pop(
-            "allow_minion_override"
-        )
+    for old_conf, new_confs in _LEGACY_CONFIG_KEYS:
+        _move_config_value(merged, old_conf, new_confs)
     if opts is not None and "vault" in opts:
         local_config = opts["vault"]
         # Respect locally configured verify parameter
-        if local_config.get("verify", NOT_SET) != NOT_SET:
-            merged["server"]["verify"] = local_config["verify"]
-        elif local_config.get("server", {}).get("verify", NOT_SET) != NOT_SET:
-            merged["server"]["verify"] = local_config["server"]["verify"]
+        local_verify = _get_local_verify(opts)
+        if local_verify is not NOT_SET:
+            merged["server"]["verify"] = local_verify
         # same for token_lifecycle
-        if local_config.get("auth", {}).get("token_lifecycle"):
+        if local_config.get("auth", _EMPTY).get("token_lifecycle"):
             merged["auth"]["token_lifecycle"] = local_config["auth"]["token_lifecycle"]
 
     if not validate:
@@ -987,3 +1078,42 @@ def parse_config(config, validate=True, opts=None, require_token=True):
     except AssertionError as err:
         raise salt.exceptions.InvalidConfigError(f"Invalid vault configuration: {err}") from err
     return merged
+
+
+def _get_local_verify(opts):
+    local_config = opts.get("vault", _EMPTY)
+    if local_config.get("verify", NOT_SET) != NOT_SET:
+        return local_config["verify"]
+    return local_config.get("server", _EMPTY).get("verify", NOT_SET)
+
+
+def _normalize_server(server, opts):
+    """
+    Returns the server configuration as if it had been run through
+    parse_config, without merging the whole default configuration.
+    """
+    normalized = {"namespace": None, "verify": None}
+    for key in ("url", "namespace", "verify"):
+        if key in server:
+            normalized[key] = server[key]
+    if opts is not None:
+        local_verify = _get_local_verify(opts)
+        if local_verify is not NOT_SET:
+            normalized["verify"] = local_verify
+    return normalized
+
+
+def _move_config_value(config, old, news):
+    *old_parents, old_key = old
+    container = config
+    for part in old_parents:
+        container = container[part]
+    if old_key not in container:
+        return
+    val = container.pop(old_key)
+    for new in news:
+        *new_parents, new_key = new
+        container = config
+        for part in new_parents:
+            container = container.setdefault(part, {})
+        container[new_key] = val
@@ -0,0 +1 @@
+__version__ = "0.1.dev1+g57434eed7"
\ No newline at end of file
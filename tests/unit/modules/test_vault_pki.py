@@ -0,0 +1,388 @@
+import time
+from unittest.mock import ANY
+from unittest.mock import call
+from unittest.mock import patch
+
+import pytest
+import saltext.vault.utils.vault as vaultutil
+from cryptography import x509
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from requests.adapters import DEFAULT_POOLSIZE
+from salt.exceptions import CommandExecutionError
+from salt.exceptions import SaltInvocationError
+from saltext.vault.modules import vault_pki
+
+
+@pytest.fixture
+def configure_loader_modules():
+    return {
+        vault_pki: {
+            "__grains__": {"id": "test-minion"},
+        }
+    }
+
+
+@pytest.fixture
+def query():
+    with patch("saltext.vault.utils.vault.query", autospec=True) as query:
+        yield query
+
+
+def test_write_role_patches_existing_role(query):
+    """
+    Ensure existing roles are updated with a single PATCH request.
+    """
+    assert vault_pki.write_role("test-role", ttl="1h") is True
+    query.assert_called_once_with(
+        "PATCH",
+        "pki/roles/test-role",
+        ANY,
+        ANY,
+        payload={"ttl": "1h"},
+        add_headers={"Content-Type": "application/merge-patch+json"},
+    )
+
+
+@pytest.mark.parametrize(
+    "exc", [vaultutil.VaultNotFoundError, vaultutil.VaultUnsupportedOperationError]
+)
+def test_write_role_falls_back_to_post(query, exc):
+    """
+    Ensure roles are written with POST when they do not exist yet
+    or the Vault server does not support patching them.
+    """
+    query.side_effect = (exc, {})
+    assert vault_pki.write_role("test-role", mount="foo", ttl="1h") is True
+    assert query.call_count == 2
+    assert query.call_args == call("POST", "foo/roles/test-role", ANY, ANY, payload={"ttl": "1h"})
+
+
+def test_write_role_raises_errors(query):
+    """
+    Ensure other Vault errors are reraised as CommandExecutionError.
+    """
+    query.side_effect = vaultutil.VaultPermissionDeniedError
+    with pytest.raises(CommandExecutionError):
+        vault_pki.write_role("test-role")
+    query.assert_called_once()
+
+
+def test_close_session():
+    """
+    Ensure the cached client connections are closed.
+    """
+    with patch("saltext.vault.utils.vault.close_session", autospec=True) as close:
+        close.return_value = True
+        assert vault_pki.close_session() is True
+        close.assert_called_once_with(ANY, ANY)
+
+
+@pytest.fixture
+def authd_client():
+    with patch("saltext.vault.utils.vault.get_authd_client", autospec=True) as get_client:
+        client = get_client.return_value
+        client.auth.get_token.return_value.num_uses = 0
+        client.post.side_effect = lambda endpoint, payload: {
+            "data": {"certificate": f"{endpoint}:{payload['common_name']}"}
+        }
+        yield client
+
+
+@pytest.mark.parametrize("num_uses", [0, 1])
+def test_issue_certificates(query, authd_client, num_uses):
+    """
+    Ensure all certificates are issued and mapped to their common names,
+    regardless of whether they are requested concurrently or not.
+    """
+    authd_client.auth.get_token.return_value.num_uses = num_uses
+    query.side_effect = lambda method, endpoint, opts, context, payload: {
+        "data": {"certificate": f"{endpoint}:{payload['common_name']}"}
+    }
+    res = vault_pki.issue_certificates(
+        [
+            {"role_name": "web", "common_name": "a.example.com"},
+            {"role_name": "web", "common_name": "b.example.com", "mount": "foo"},
+        ]
+    )
+    assert res == {
+        "a.example.com": {"certificate": "pki/issue/web:a.example.com"},
+        "b.example.com": {"certificate": "foo/issue/web:b.example.com"},
+    }
+    if num_uses:
+        assert query.call_count == 2
+        authd_client.post.assert_not_called()
+    else:
+        # Concurrent requests must not go through the context-mutating query
+        query.assert_not_called()
+        assert authd_client.post.call_count == 2
+
+
+def test_issue_certificates_single_skips_client(query):
+    """
+    Ensure a single certificate is issued directly without acquiring
+    the client for the batch.
+    """
+    query.return_value = {"data": {"certificate": "pem"}}
+    with patch("saltext.vault.utils.vault.get_authd_client", autospec=True) as get_client:
+        res = vault_pki.issue_certificates([{"role_name": "web", "common_name": "a.example.com"}])
+    assert res == {"a.example.com": {"certificate": "pem"}}
+    get_client.assert_not_called()
+
+
+def test_issue_certificates_caps_workers_to_pool_size(authd_client):
+    """
+    Ensure there are not more workers than pooled connections of the session.
+    """
+    with patch(
+        "saltext.vault.modules.vault_pki.ThreadPoolExecutor",
+        wraps=vault_pki.ThreadPoolExecutor,
+    ) as executor:
+        vault_pki.issue_certificates(
+            [
+                {"role_name": "web", "common_name": "a.example.com"},
+                {"role_name": "web", "common_name": "b.example.com"},
+            ],
+            max_workers=32,
+        )
+    executor.assert_called_once_with(max_workers=DEFAULT_POOLSIZE)
+    assert authd_client.post.call_count == 2
+
+
+def test_issue_certificates_raises_errors(authd_client):
+    """
+    Ensure errors while issuing a certificate are reraised.
+    """
+    authd_client.post.side_effect = vaultutil.VaultServerError
+    with pytest.raises(CommandExecutionError):
+        vault_pki.issue_certificates(
+            [
+                {"role_name": "web", "common_name": "a.example.com"},
+                {"role_name": "web", "common_name": "b.example.com"},
+            ]
+        )
+
+
+def test_issue_certificates_retries_denied(query, authd_client):
+    """
+    Ensure requests that were denied are retried through the regular query,
+    which refreshes the cached authentication.
+    """
+    authd_client.post.side_effect = vaultutil.VaultPermissionDeniedError
+    query.return_value = {"data": {"certificate": "pem"}}
+    res = vault_pki.issue_certificates(
+        [
+            {"role_name": "web", "common_name": "a.example.com"},
+            {"role_name": "web", "common_name": "b.example.com"},
+        ]
+    )
+    assert res == {
+        "a.example.com": {"certificate": "pem"},
+        "b.example.com": {"certificate": "pem"},
+    }
+    assert query.call_count == 2
+
+
+def test_issue_certificates_duplicate_common_names(authd_client):
+    """
+    Ensure duplicate common names are rejected instead of discarding
+    one of the issued certificates.
+    """
+    with pytest.raises(SaltInvocationError, match="a.example.com"):
+        vault_pki.issue_certificates(
+            [
+                {"role_name": "web", "common_name": "a.example.com"},
+                {"role_name": "other", "common_name": "a.example.com"},
+            ]
+        )
+    authd_client.post.assert_not_called()
+
+
+def test_read_issuer_certificate_is_cached(query):
+    """
+    Ensure the issuer certificate is only requested once per issuer
+    while the cached value is fresh.
+    """
+    query.return_value = {"data": {"certificate": "pem"}}
+    assert vault_pki.read_issuer_certificate("default") == "pem"
+    assert vault_pki.read_issuer_certificate("default") == "pem"
+    query.assert_called_once_with("GET", "pki/issuer/default", ANY, ANY)
+    vault_pki.read_issuer_certificate("other")
+    assert query.call_count == 2
+    with patch("time.monotonic", return_value=time.monotonic() + vault_pki.CACHE_TTL):
+        vault_pki.read_issuer_certificate("default")
+    assert query.call_count == 3
+
+
+@pytest.mark.parametrize(
+    "sans",
+    [
+        ["DNS:a.example.com", "ip:10.0.0.1", "URI:spiffe://foo", "email:a@example.com", "1.2.3:x"],
+        {
+            "DNS": "a.example.com",
+            "ip": "10.0.0.1",
+            "URI": "spiffe://foo",
+            "email": "a@example.com",
+            "1.2.3": "x",
+        },
+    ],
+)
+def test_split_sans(sans):
+    """
+    Ensure SANs passed as a list or dict are sorted into the parameters
+    expected by Vault.
+    """
+    res = vault_pki._split_sans(sans)  # pylint: disable=protected-access
+    assert res == (
+        ["a.example.com", "a@example.com"],
+        ["10.0.0.1"],
+        ["spiffe://foo"],
+        ["1.2.3;UTF8:x"],
+    )
+
+
+@pytest.fixture(scope="module")
+def rsa_privkey():
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    return key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption(),
+    ).decode()
+
+
+@pytest.mark.parametrize("digest", ["sha256", "SHA3_512"])
+def test_build_csr(rsa_privkey, digest):
+    """
+    Ensure a PEM-encoded CSR signed with the requested digest is returned.
+    """
+    res = vault_pki._build_csr(
+        rsa_privkey, digest=digest, CN="foo"
+    )  # pylint: disable=protected-access
+    csr = x509.load_pem_x509_csr(res.encode())
+    assert csr.is_signature_valid
+    assert csr.signature_hash_algorithm.name == digest.lower().replace("_", "-")
+
+
+def test_build_csr_invalid_digest(rsa_privkey):
+    """
+    Ensure unknown digests are rejected.
+    """
+    with pytest.raises(CommandExecutionError, match="Invalid value 'md5' for digest"):
+        vault_pki._build_csr(
+            rsa_privkey, digest="md5", CN="foo"
+        )  # pylint: disable=protected-access
+
+
+def test_read_role_cached_until_written(query):
+    """
+    Ensure roles are cached and writing a role invalidates them.
+    """
+    query.return_value = {"data": {"ttl": 3600}}
+    role = vault_pki.read_role("test-role")
+    role["ttl"] = 1
+    assert vault_pki.read_role("test-role") == {"ttl": 3600}
+    query.assert_called_once()
+    vault_pki.write_role("test-role", ttl="1h")
+    vault_pki.read_role("test-role")
+    assert query.call_count == 3
+    vault_pki.delete_role("test-role")
+    vault_pki.read_role("test-role")
+    assert query.call_count == 5
+
+
+def test_list_roles_cached_until_written(query):
+    """
+    Ensure the list of roles is cached and writing a role invalidates it.
+    """
+    query.return_value = {"data": {"keys": ["test-role"]}}
+    assert vault_pki.list_roles() == ["test-role"]
+    assert vault_pki.list_roles() == ["test-role"]
+    query.assert_called_once()
+    vault_pki.list_roles(mount="other")
+    assert query.call_count == 2
+    vault_pki.write_role("new-role")
+    vault_pki.list_roles()
+    assert query.call_count == 4
+
+
+def test_write_role_payload(query):
+    """
+    Ensure only the role parameters that were set are sent,
+    together with additional ones passed as kwargs.
+    """
+    vault_pki.write_role(
+        "test-role",
+        mount="foo",
+        ttl="1h",
+        allow_localhost=False,
+        cn_validations=["hostname"],
+        allow_subdomains=True,
+        __pub_fun="vault_pki.write_role",
+    )
+    assert query.call_args.kwargs["payload"] == {
+        "ttl": "1h",
+        "allow_localhost": False,
+        "cn_validations": ["hostname"],
+        "allow_subdomains": True,
+    }
+
+
+def test_write_role_remembers_unsupported_patch(query):
+    """
+    Ensure PATCH is not retried while it is known to be unsupported.
+    """
+    query.side_effect = (vaultutil.VaultUnsupportedOperationError, {}, {})
+    vault_pki.write_role("test-role", ttl="1h")
+    vault_pki.write_role("other-role", ttl="1h")
+    assert [c.args[0] for c in query.call_args_list] == ["PATCH", "POST", "POST"]
+
+
+@pytest.mark.parametrize("kwargs", [{}, {"__pub_fun": "vault_pki.issue_certificate"}])
+def test_issue_certificate_payload(query, kwargs):
+    """
+    Ensure Salt-internal kwargs are not sent to Vault.
+    """
+    query.return_value = {"data": {"certificate": "pem"}}
+    res = vault_pki.issue_certificate("web", "a.example.com", ttl="1h", **kwargs)
+    assert res == {"certificate": "pem"}
+    query.assert_called_once_with(
+        "POST",
+        "pki/issue/web",
+        ANY,
+        ANY,
+        payload={
+            "common_name": "a.example.com",
+            "ttl": "1h",
+            "format": "pem",
+            "exclude_cn_from_sans": False,
+        },
+    )
+
+
+@pytest.mark.parametrize(
+    "sans",
+    [
+        ["DNS:a.example.com", "email:a@example.com"],
+        {"DNS": "a.example.com", "email": "a@example.com"},
+    ],
+)
+def test_build_csr_subject_alt_name(rsa_privkey, sans):
+    """
+    Ensure SANs passed as a list or dict are added to the CSR with their types.
+    """
+    res = vault_pki._build_csr(  # pylint: disable=protected-access
+        rsa_privkey, subject_alt_name=sans, CN="foo"
+    )
+    csr = x509.load_pem_x509_csr(res.encode())
+    ext = csr.extensions.get_extension_for_class(x509.SubjectAlternativeName).value
+    assert ext.get_values_for_type(x509.DNSName) == ["a.example.com"]
+    assert ext.get_values_for_type(x509.RFC822Name) == ["a@example.com"]
+
+
+def test_split_sans_invalid():
+    """
+    Ensure list entries without a SAN type are rejected.
+    """
+    with pytest.raises(SaltInvocationError, match="Invalid alt name 'example.com'"):
+        vault_pki._split_sans(["example.com"])  # pylint: disable=protected-access
@@ -0,0 +1,280 @@
+from datetime import datetime
+from datetime import timedelta
+from datetime import timezone
+from unittest.mock import Mock
+from unittest.mock import patch
+
+import pytest
+from salt.exceptions import CommandExecutionError
+from salt.exceptions import SaltInvocationError
+from saltext.vault.modules import vault_pki as vault_pki_exe
+from saltext.vault.states import vault_pki
+
+
+@pytest.fixture
+def configure_loader_modules():
+    return {vault_pki: {"__low__": {"__id__": "test-cert"}}}
+
+
+@pytest.fixture
+def read_issuer_certificate():
+    read = Mock(return_value="pem", spec=vault_pki_exe.read_issuer_certificate)
+    with patch.dict(vault_pki.__salt__, {"vault_pki.read_issuer_certificate": read}):
+        yield read
+
+
+def test_load_issuer_certificate_parses_once(read_issuer_certificate):
+    """
+    Ensure the issuer certificate is only parsed once as long as
+    the PEM does not change.
+    """
+    with patch("salt.utils.x509.load_cert", autospec=True) as load_cert:
+        first = vault_pki._load_issuer_certificate(  # pylint: disable=protected-access
+            "default", "pki"
+        )
+        second = vault_pki._load_issuer_certificate(  # pylint: disable=protected-access
+            "default", "pki"
+        )
+        load_cert.assert_called_once_with("pem")
+        assert first is second
+        read_issuer_certificate.return_value = "other-pem"
+        vault_pki._load_issuer_certificate("default", "pki")  # pylint: disable=protected-access
+        assert load_cert.call_count == 2
+    read_issuer_certificate.assert_called_with("default", mount="pki")
+    # The execution module's cache is not shared
+    assert vault_pki_exe.CONTEXT_KEY not in vault_pki.__context__
+
+
+def _file_managed_stub(name, **kwargs):  # pylint: disable=unused-argument
+    return {"test": __opts__["test"]}  # pylint: disable=undefined-variable
+
+
+def _manage_file_stub(*args, **kwargs):  # pylint: disable=unused-argument
+    return {}
+
+
+def test_file_managed_overrides_test_without_modifying_opts():
+    """
+    Ensure file.managed is run with the requested test flag, while
+    the state's own __opts__ stay untouched.
+    """
+    with patch.dict(vault_pki.__opts__, {"test": False, "nested": {"foo": "bar"}}):
+        with patch.dict(vault_pki.__states__, {"file.managed": _file_managed_stub}):
+            with patch.dict(vault_pki.__salt__, {"file.manage_file": _manage_file_stub}):
+                res = vault_pki._file_managed("/foo", test=True)  # pylint: disable=protected-access
+        assert res == {"test": True}
+        assert vault_pki.__opts__["test"] is False
+        assert vault_pki.__opts__["nested"] == {"foo": "bar"}
+
+
+@pytest.fixture
+def file_managed():
+    with patch("saltext.vault.states.vault_pki._file_managed", autospec=True) as managed:
+        managed.return_value = {"result": True, "changes": {}, "comment": ""}
+        yield managed
+
+
+@pytest.fixture
+def cert_file(tmp_path):
+    path = tmp_path / "cert.pem"
+    path.write_text("certificate")
+    return str(path)
+
+
+@pytest.fixture
+def load_cert():
+    with patch.dict(vault_pki.__salt__, {"file.file_exists": Mock(return_value=True)}):
+        with patch("salt.utils.x509.load_cert", autospec=True) as load:
+            yield load
+
+
+@pytest.fixture
+def current_cert(request, load_cert):
+    cert = Mock()
+    cert.subject.get_attributes_for_oid.return_value = [Mock(value="test.example.com")]
+    cert.not_valid_after_utc = datetime.now(timezone.utc) + timedelta(days=request.param)
+    load_cert.return_value = (cert, "pem", [], None)
+    return cert
+
+
+@pytest.fixture
+def compare_cert():
+    with patch("saltext.vault.states.vault_pki._load_issuer_certificate", autospec=True):
+        with patch("salt.utils.x509.load_privkey", autospec=True):
+            with patch("saltext.vault.states.vault_pki._compare_cert", autospec=True) as compare:
+                compare.return_value = {}
+                yield compare
+
+
+@pytest.mark.usefixtures("file_managed")
+@pytest.mark.parametrize(
+    "current_cert,expected", [(30, {}), (1, {"expiration": True})], indirect=["current_cert"]
+)
+def test_certificate_managed_compares_kept_certificates_only(
+    current_cert, compare_cert, expected, cert_file
+):
+    """
+    Ensure the certificate is only verified against the issuer and key
+    when it would otherwise be kept.
+    """
+    with patch.dict(vault_pki.__opts__, {"test": True}):
+        res = vault_pki.certificate_managed(cert_file, "test.example.com", "web", private_key="key")
+    assert res["changes"] == expected
+    if expected:
+        compare_cert.assert_not_called()
+    else:
+        compare_cert.assert_called_once()
+        assert compare_cert.call_args[0][0] is current_cert
+
+
+@pytest.mark.usefixtures("file_managed", "compare_cert")
+@pytest.mark.parametrize("current_cert", [1], indirect=True)
+def test_certificate_managed_expiration_naive_not_after(current_cert, cert_file):
+    """
+    Ensure the expiration check works with cryptography releases
+    that only provide the naive not_valid_after.
+    """
+    current_cert.not_valid_after = current_cert.not_valid_after_utc.replace(tzinfo=None)
+    del current_cert.not_valid_after_utc
+    with patch.dict(vault_pki.__opts__, {"test": True}):
+        res = vault_pki.certificate_managed(cert_file, "test.example.com", "web", private_key="key")
+    assert res["changes"] == {"expiration": True}
+
+
+@pytest.mark.usefixtures("file_managed", "compare_cert")
+@pytest.mark.parametrize("current_cert", [30], indirect=True)
+def test_certificate_managed_parses_unchanged_file_once(current_cert, load_cert, cert_file):
+    """
+    Ensure the managed certificate is only parsed again when the file changed.
+    """
+    with patch.dict(vault_pki.__opts__, {"test": True}):
+        for _ in range(2):
+            vault_pki.certificate_managed(cert_file, "test.example.com", "web", private_key="key")
+        load_cert.assert_called_once()
+        with open(cert_file, "a", encoding="utf-8") as f:
+            f.write("changed")
+        res = vault_pki.certificate_managed(cert_file, "test.example.com", "web", private_key="key")
+    assert load_cert.call_count == 2
+    assert res["result"] is True
+
+
+@pytest.mark.parametrize(
+    "common_names", [("a.example.com", "b.example.com"), ("a.example.com",) * 2]
+)
+def test_certificates_managed(file_managed, common_names):
+    """
+    Ensure missing certificates are issued in a single batch, unless
+    their common names are ambiguous, and the results are aggregated.
+    """
+    issue_batch = Mock(
+        side_effect=lambda certs, max_workers: {
+            cert["common_name"]: {"certificate": cert["common_name"]} for cert in certs
+        }
+    )
+    issue = Mock(side_effect=lambda **cert: {"certificate": cert["common_name"]})
+    certificates = {f"/{cn}-{i}.crt": {"common_name": cn} for i, cn in enumerate(common_names)}
+    with patch.dict(
+        vault_pki.__salt__,
+        {
+            "file.file_exists": Mock(return_value=False),
+            "vault_pki.issue_certificates": issue_batch,
+            "vault_pki.issue_certificate": issue,
+        },
+    ):
+        with patch.dict(vault_pki.__opts__, {"test": False}):
+            res = vault_pki.certificates_managed(
+                "certs", certificates, max_workers=4, role_name="web"
+            )
+    assert res["result"] is True
+    assert res["changes"] == {path: {"created": path} for path in certificates}
+    if len(set(common_names)) == len(common_names):
+        issue_batch.assert_called_once()
+        assert issue_batch.call_args.kwargs == {"max_workers": 4}
+        issue.assert_not_called()
+    else:
+        issue_batch.assert_not_called()
+        assert issue.call_count == 2
+    for path, params in certificates.items():
+        file_managed.assert_any_call(
+            path, contents=params["common_name"], replace=True, show_changes=False
+        )
+
+
+@pytest.mark.parametrize("exc", [CommandExecutionError, SaltInvocationError])
+def test_certificates_managed_issue_error(file_managed, exc):  # pylint: disable=unused-argument
+    """
+    Ensure failures while issuing the certificates are reported for each one.
+    """
+    with patch.dict(
+        vault_pki.__salt__,
+        {
+            "file.file_exists": Mock(return_value=False),
+            "vault_pki.issue_certificates": Mock(side_effect=exc("oops")),
+        },
+    ):
+        with patch.dict(vault_pki.__opts__, {"test": False}):
+            res = vault_pki.certificates_managed(
+                "certs",
+                {"/a.crt": {"common_name": "a"}, "/b.crt": {"common_name": "b"}},
+                role_name="web",
+            )
+    assert res["result"] is False
+    assert res["changes"] == {}
+    assert res["comment"] == "/a.crt: oops\n/b.crt: oops"
+
+
+@pytest.mark.parametrize("same_issuer", [True, False])
+def test_compare_cert_issuer_name(same_issuer):
+    """
+    Ensure a differing issuer name is reported.
+    """
+    current = Mock()
+    signing_cert = Mock()
+    if same_issuer:
+        signing_cert.issuer = current.issuer
+    with patch("salt.utils.x509.verify_signature", autospec=True, return_value=True):
+        with patch("salt.utils.x509.is_pair", autospec=True, return_value=True):
+            res = vault_pki._compare_cert(  # pylint: disable=protected-access
+                current, signing_cert, "key"
+            )
+    if same_issuer:
+        assert res == {}
+    else:
+        assert res == {"issuer_name": signing_cert.issuer.rfc4514_string.return_value}
+        signing_cert.issuer.rfc4514_string.assert_called_once()
+
+
+@pytest.mark.usefixtures("file_managed")
+@pytest.mark.parametrize(
+    "kwargs,ttl", [({"ttl": "1h"}, "1h"), ({"days_valid": 90}, "2160h"), ({}, None)]
+)
+def test_certificate_managed_issue_args(kwargs, ttl):
+    """
+    Ensure the certificate is issued from the configured mount with the
+    requested validity and the local private key is not sent to Vault.
+    """
+    issue = Mock(return_value={"certificate": "pem"})
+    with patch.dict(
+        vault_pki.__salt__,
+        {"file.file_exists": Mock(return_value=False), "vault_pki.issue_certificate": issue},
+    ):
+        with patch.dict(vault_pki.__opts__, {"test": False}):
+            res = vault_pki.certificate_managed(
+                "/a.crt",
+                "a.example.com",
+                "web",
+                private_key="key",
+                private_key_passphrase="pass",
+                mount_point="foo",
+                **kwargs,
+            )
+    assert res["result"] is True
+    expected = {
+        "common_name": "a.example.com",
+        "role_name": "web",
+        "issuer": "default",
+        "mount": "foo",
+    }
+    if ttl is not None:
+        expected["ttl"] = ttl
+    issue.assert_called_once_with(**expected)
@@ -6,6 +6,8 @@ from unittest.mock import patch
 
 import pytest
 import salt.exceptions
+import salt.utils.data
+import salt.utils.dictupdate
 from saltext.vault.utils import vault
 from saltext.vault.utils.vault import cache as vcache
 from saltext.vault.utils.vault import client as vclient
@@ -192,8 +194,10 @@ class TestGetAuthdClient:
         assert client.token_valid()
         if session:
             clear_cache.assert_called_once_with({}, ANY, force_local=False, session=session)
+            assert not build_exception_first.call_args.kwargs.get("skip_cache_probe")
         else:
             clear_cache.assert_called_once_with({}, ANY, force_local=False, connection=True)
+            assert build_exception_first.call_args.kwargs["skip_cache_probe"] is True
         assert build_exception_first.call_count == 2
         if get_config:
             assert config == {
@@ -248,6 +252,28 @@ class TestGetAuthdClient:
         client.token_renew.assert_called_once_with(increment=60)
         clear_cache.assert_not_called()
 
+    @pytest.mark.usefixtures("build_renewable")
+    def test_get_authd_client_checks_renewal_with_single_token_lookup(self):
+        """
+        Ensure the token is only fetched once for the renewal check
+        and minimum_ttl is respected in all validity checks.
+        """
+        client = vault.get_authd_client({}, {}, get_config=False)
+        client.auth.get_token.assert_called_once()
+        client.auth.get_token.return_value.is_valid.assert_called_once_with(10)
+        client.token_valid.assert_called_once_with(10, remote=False)
+
+    def test_get_authd_client_renewal_unset_minimum_ttl(self, client_renewable):
+        """
+        Ensure an unset minimum_ttl is treated as 0 during the renewal check.
+        """
+        config = {"auth": {"token_lifecycle": {"minimum_ttl": None, "renew_increment": 60}}}
+        with patch("saltext.vault.utils.vault.factory._build_authd_client", autospec=True) as build:
+            build.return_value = (client_renewable, config)
+            vault.get_authd_client({}, {})
+        client_renewable.auth.get_token.return_value.is_valid.assert_called_once_with(0)
+        client_renewable.token_valid.assert_called_once_with(0, remote=False)
+
     @pytest.mark.usefixtures("build_unrenewable")
     def test_get_authd_client_unrenewable_new_token(self, clear_cache):
         """
@@ -429,6 +455,28 @@ class TestGetConnectionConfig:
         cached.store.assert_not_called()
         remote.assert_not_called()
 
+    def test_get_connection_config_cached_reuses_client(
+        self, cached, remote, test_remote_config
+    ):  # pylint: disable=unused-argument
+        """
+        Ensure the unauthenticated client is reused as long as
+        the server configuration does not change.
+        """
+        context = {}
+        _, _, first = vfactory._get_connection_config(  # pylint: disable=protected-access
+            "vault", {}, context
+        )
+        _, _, second = vfactory._get_connection_config(  # pylint: disable=protected-access
+            "vault", {}, context
+        )
+        assert second is first
+        test_remote_config["server"]["url"] = "https://other.vault:8200"
+        _, _, third = vfactory._get_connection_config(  # pylint: disable=protected-access
+            "vault", {}, context
+        )
+        assert third is not first
+        assert third.url == "https://other.vault:8200"
+
     def test_get_connection_config_uncached(self, uncached, remote):
         """
         Ensure uncached configuration is treated as expected, especially
@@ -951,6 +999,19 @@ class TestFetchToken:
         cached.store.assert_not_called()
         remote.assert_not_called()
 
+    @pytest.mark.parametrize("test_remote_config", ["token", "wrapped_token"], indirect=True)
+    def test_fetch_token_skip_cache_probe(
+        self, test_remote_config, cached, remote, unauthd_client_mock
+    ):
+        """
+        Ensure the cache is not probed when it is known to be empty
+        """
+        vfactory._fetch_token(  # pylint: disable=protected-access
+            test_remote_config, {}, cached, unauthd_client_mock, skip_cache_probe=True
+        )
+        cached.get.assert_not_called()
+        remote.assert_called_once()
+
     @pytest.mark.parametrize("test_remote_config", ["token"], indirect=True)
     def test_fetch_token_uncached_embedded(
         self, test_remote_config, uncached, remote, token_auth, unauthd_client_mock
@@ -1077,14 +1138,9 @@ class TestQueryMaster:
             with patch("salt.utils.context.func_globals_inject"):
                 yield runner
 
-    @pytest.fixture(autouse=True, scope="class")
-    def b64encode_sig(self):
-        with patch("base64.b64encode", Mock(return_value="signature")):
-            yield
-
     @pytest.fixture(autouse=True, scope="class")
     def salt_crypt(self):
-        with patch("salt.crypt.sign_message", Mock(return_value="signature")):
+        with patch("salt.crypt.sign_message", Mock(return_value=b"signature")):
             yield
 
     @pytest.fixture(params=["minion"])
@@ -1137,6 +1193,19 @@ class TestQueryMaster:
             publish_runner.assert_called_once()
             saltutil_runner.assert_not_called()
 
+    @pytest.mark.parametrize("opts", ["master", "minion"], indirect=True)
+    def test_query_master_signs_minion_id_once(self, opts):
+        """
+        Ensure the minion ID signature is reused for subsequent requests
+        """
+        with patch("salt.crypt.sign_message", Mock(return_value=b"signature")) as sign:
+            with patch.dict(
+                vfactory._SIGNATURE_CACHE, clear=True  # pylint: disable=protected-access
+            ):
+                vfactory._query_master("func", opts)  # pylint: disable=protected-access
+                vfactory._query_master("func", opts)  # pylint: disable=protected-access
+        sign.assert_called_once_with(f"{opts['pki_dir']}/{opts['__role']}.pem", "test-minion")
+
     @pytest.mark.parametrize("response", [None, False, {}, "f", {"error": "error"}])
     def test_query_master_validates_response(self, opts, response, publish_runner, saltutil_runner):
         """
@@ -1284,6 +1353,7 @@ class TestQueryMaster:
         assert key in out
         assert out[key] == {"bar": "baz"}
 
+    @pytest.mark.parametrize("nested", ["auth:role_id", "role_id"])
     @pytest.mark.parametrize("unauthd_client_mock", ["data", "auth"], indirect=True)
     def test_query_master_merges_nested_unwrapped_result(
         self,
@@ -1293,22 +1363,27 @@ class TestQueryMaster:
         wrapped_role_id_response,
         unauthd_client_mock,
         server_config,
+        nested,
     ):
         """
         Ensure that "data"/"auth" keys from unwrapped results of nested
         wrapped responses are correctly merged
         """
-        publish_runner.return_value = saltutil_runner.return_value = {
+        response = {
             "server": server_config,
-            "wrap_info_nested": ["auth:role_id"],
-            "auth": {"role_id": {"wrap_info": wrapped_role_id_response["wrap_info"]}},
+            "wrap_info_nested": [nested],
         }
+        salt.utils.dictupdate.set_dict_key_value(
+            response, nested, {"wrap_info": wrapped_role_id_response["wrap_info"]}
+        )
+        publish_runner.return_value = saltutil_runner.return_value = response
         out, _ = vfactory._query_master(  # pylint: disable=protected-access
             "func", opts, unwrap_client=unauthd_client_mock
         )  # pylint: disable=protected-access
         assert "wrap_info_nested" not in out
-        assert "wrap_info" not in out["auth"]["role_id"]
-        assert out["auth"]["role_id"] == {"bar": "baz"}
+        unwrapped = salt.utils.data.traverse_dict(out, nested)
+        assert "wrap_info" not in unwrapped
+        assert unwrapped == {"bar": "baz"}
 
     @pytest.mark.parametrize("misc_data", ["secret_id_num_uses", "secret_id_ttl"])
     @pytest.mark.parametrize("key", ["auth", "data"])
@@ -1455,6 +1530,25 @@ def test_clear_cache_clears_client_from_context(
         assert vfactory.CLIENT_CKEY not in context.get(cbank, {})
 
 
+def test_close_session():
+    """
+    Ensure the HTTP session shared by the cached clients is closed once
+    and the clients are kept.
+    """
+    session = Mock()
+    authd, unauthd = Mock(session=session), Mock(session=session)
+    context = {
+        "vault/connection": {
+            vfactory.CLIENT_CKEY: (authd, {}),
+            vfactory.UNAUTHD_CLIENT_CKEY: unauthd,
+        }
+    }
+    assert vault.close_session({}, context) is True
+    session.close.assert_called_once()
+    assert context["vault/connection"][vfactory.CLIENT_CKEY] == (authd, {})
+    assert vault.close_session({}, {}) is False
+
+
 @pytest.mark.parametrize(
     "test_config,expected_config,expected_token",
     [
@@ -1526,11 +1620,30 @@ def test_use_local_config(test_config, expected_config, expected_token):
     and pops an embedded token, if present
     """
     with patch("saltext.vault.utils.vault.factory.parse_config", Mock(return_value=test_config)):
-        output, token, _ = vfactory._use_local_config({})  # pylint: disable=protected-access
+        output, token, _ = vfactory._use_local_config(  # pylint: disable=protected-access
+            {}, {}, "vault"
+        )
         assert output == expected_config
         assert token == expected_token
 
 
+@pytest.mark.parametrize(
+    "opts,expected",
+    [
+        ({}, None),
+        ({"vault": {"issue_params": {}}}, None),
+        ({"vault": {"issue_params": {"num_uses": 3}}}, {"num_uses": 3}),
+        ({"vault": {"auth": {"ttl": 60, "uses": 3}}}, {"explicit_max_ttl": 60, "num_uses": 3}),
+    ],
+)
+def test_get_issue_params(opts, expected):
+    """
+    Ensure issue_params are read from the local configuration
+    and the old configuration format is respected.
+    """
+    assert vfactory._get_issue_params(opts) == expected  # pylint: disable=protected-access
+
+
 @pytest.mark.parametrize(
     "config,expected",
     [
@@ -1570,6 +1683,18 @@ def test_parse_config_respects_local_verify(opts):
     assert ret["server"]["verify"] == testval
 
 
+def test_parse_config_does_not_modify_defaults():
+    """
+    Ensure the shared default configuration is not modified by parsing.
+    """
+    defaults = copy.deepcopy(vfactory._DEFAULT_CONFIG)  # pylint: disable=protected-access
+    config = {"auth": {"token": "test-token"}, "server": {"url": "test-url"}}
+    res = vfactory.parse_config(config, opts={"vault": {"verify": False}})
+    res["auth"]["token_lifecycle"]["minimum_ttl"] = 1337
+    res["policies"]["assign"].append("foo")
+    assert vfactory._DEFAULT_CONFIG == defaults  # pylint: disable=protected-access
+
+
 ############################################
 # Deprecation tests
 ############################################